@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий буферизованный журнал для всех программ AstraAdminTool.
+
+write() только кладет строку в очередь, а файл пишет фоновый поток:
+он собирает строки за FLUSH_INTERVAL (или до BATCH_LINES штук) и
+дописывает их одним открытием файла. Файл открывается на каждую пачку,
+поэтому его можно удалять и ротировать во время работы. Очереди
+сбрасываются на диск при выходе (atexit). install_crash_hooks(),
+вызываемый из точки входа программы, пишет необработанные исключения в
+журнал строками [CRASH]. Исключение в главном потоке после этого
+завершает процесс с кодом 1: PyQt5 с пользовательским sys.excepthook
+сам процесс не останавливает (qFatal не вызывается), а продолжать
+настройку после сбоя в слоте нельзя. Исключения в прочих потоках только
+записываются, как и без хуков.
+
+При ASTRA_LOG_JSONL=1 (или jsonl=True) рядом пишется <имя>.jsonl —
+по записи {"ts", "level", "task", "msg"} на строку для разбора скриптами.
+Имя задачи берется из task_context() текущего потока.
+"""
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+import traceback
+from datetime import datetime
+from contextlib import contextmanager
+from pathlib import Path
+
+FLUSH_INTERVAL = 0.2
+BATCH_LINES = 1000
+JSONL_ENV = "ASTRA_LOG_JSONL"
+LEVEL_RE = re.compile(r"^(?:\[[\d\-: ]+\] )?\[([A-Z]+)\]")
+
+# Служебные элементы очереди: досрочный сброс пачки и остановка потока
+_FLUSH = object()
+_CLOSE = object()
+
+_logs = {}
+_logs_lock = threading.Lock()
+_context = threading.local()
+
+
+@contextmanager
+def task_context(name):
+    """Имя задачи для записей, сделанных в этом потоке."""
+    previous = getattr(_context, "task", None)
+    _context.task = name
+    try:
+        yield
+    finally:
+        _context.task = previous
+
+
+def current_task():
+    return getattr(_context, "task", None)
+
+
+def level_of(msg):
+    """Уровень по префиксу строки: [ERR] -> ERR, без префикса — INFO."""
+    m = LEVEL_RE.match(msg)
+    return m.group(1) if m else "INFO"
+
+
+class AsyncLog:
+    """Журнал в файл path с фоновой записью пачками."""
+
+    def __init__(self, path, jsonl=None):
+        self.path = Path(path)
+        if jsonl is None:
+            jsonl = os.environ.get(JSONL_ENV) == "1"
+        self.jsonl_path = self.path.with_suffix(".jsonl") if jsonl else None
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"log:{self.path.name}")
+        self._thread.start()
+
+    def write(self, msg, task=None, level=None):
+        if task is None:
+            task = current_task()
+        self._queue.put((datetime.now(), msg, task, level))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Добираем строки, пришедшие за FLUSH_INTERVAL после первой
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while item is not _FLUSH and item is not _CLOSE \
+                    and len(batch) < BATCH_LINES:
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batch.append(item)
+            records = [i for i in batch if isinstance(i, tuple)]
+            if records:
+                self._flush(records)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is _CLOSE:
+                return
+
+    def _flush(self, items):
+        # Каталог не создается: если его удалили (например, при удалении
+        # программы), запись должна не удаться, а не воссоздать его
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(msg + "\n" for _ts, msg, _task, _level in items))
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    for ts, msg, task, level in items:
+                        f.write(json.dumps({
+                            "ts": ts.isoformat(timespec="milliseconds"),
+                            "level": level or level_of(msg),
+                            "task": task,
+                            "msg": msg}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            self.error = e
+
+    def flush(self):
+        """Ждет, пока все записанные строки окажутся в файле."""
+        if self._thread.is_alive():
+            self._queue.put(_FLUSH)
+            self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+
+def get_log(path, jsonl=None):
+    """Общий AsyncLog для файла path (один фоновый поток на файл)."""
+    key = str(path)
+    with _logs_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = _logs[key] = AsyncLog(path, jsonl)
+        return log
+
+
+def flush_all():
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.flush()
+
+
+def _close_all():
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.close()
+
+
+def _crash(lines):
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        for line in lines:
+            log.write(f"[CRASH] {line}", level="CRASH")
+    flush_all()
+
+
+_previous_excepthook = sys.excepthook
+_previous_thread_excepthook = threading.excepthook
+
+
+def _excepthook(exc_type, exc, tb):
+    _crash("".join(traceback.format_exception(exc_type, exc, tb)).splitlines())
+    _previous_excepthook(exc_type, exc, tb)
+    _close_all()
+    # Как qFatal у PyQt5 без пользовательского хука: дальше не работаем
+    os._exit(1)
+
+
+def _thread_excepthook(args):
+    if args.exc_type is not SystemExit:
+        _crash("".join(traceback.format_exception(
+            args.exc_type, args.exc_value, args.exc_traceback)).splitlines())
+    _previous_thread_excepthook(args)
+
+
+def install_crash_hooks():
+    """Пишет необработанные исключения в журналы; см. описание модуля."""
+    sys.excepthook = _excepthook
+    threading.excepthook = _thread_excepthook
+
+
+atexit.register(_close_all)
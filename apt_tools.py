@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Запуск apt-get с разбором машиночитаемого канала состояния APT::Status-Fd.
+
+Строки dlstatus/pmstatus превращаются в проценты выполнения, а смена
+пакета в pmstatus дает время обработки каждого пакета.
+
+update_local_repo — быстрый apt update только по источнику file:/opt/repo,
+пропускаемый целиком, если dists/*/Release не менялись с прошлого раза.
+Если источника нет в sources.list(.d), он добавляется в LOCAL_LIST, чтобы
+его видели и последующие apt-get install.
+"""
+import os
+import re
+import glob
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+
+from cmd_stream import stream_cmd
+from repo_sync import REPO_DIR
+
+STATUS_RE = re.compile(
+    r"^(dlstatus|pmstatus|pmerror|pmconffile):(.*?):(\d+(?:\.\d+)?):(.*)$")
+PROGRESS_STEP = 10
+SLOWEST_PACKAGES = 5
+SOURCES_LIST = Path("/etc/apt/sources.list")
+SOURCES_PARTS = Path("/etc/apt/sources.list.d")
+APT_LISTS = Path("/var/lib/apt/lists")
+FINGERPRINT_NAME = ".astra_release_fingerprint"
+LOCAL_LIST = SOURCES_PARTS / "astra-local-repo.list"
+
+
+class AptProgress:
+    """Разбирает строки APT::Status-Fd и пишет прогресс в log_func."""
+
+    def __init__(self, log_func, step=PROGRESS_STEP):
+        self.log_func = log_func
+        self.step = step
+        self.percent = 0.0
+        self._bucket = -1
+        self._package = None
+        self._package_started = None
+        self.timings = {}
+
+    def _switch_package(self, package):
+        now = time.monotonic()
+        if self._package is not None:
+            self.timings[self._package] = self.timings.get(self._package, 0.0) \
+                + now - self._package_started
+        self._package = package
+        self._package_started = now
+
+    def feed(self, line):
+        m = STATUS_RE.match(line)
+        if not m:
+            return
+        kind, item, percent, text = m.groups()
+        if kind == "pmerror":
+            self.log_func(f"[ERR] {item}: {text}")
+            return
+        if kind == "pmconffile":
+            return
+        if kind == "pmstatus" and item != self._package:
+            self._switch_package(item)
+        self.percent = float(percent)
+        bucket = int(self.percent) // self.step
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self.log_func(f"[APT] {self.percent:.0f}% {text}")
+
+    def finish(self):
+        if self._package is not None:
+            self._switch_package(None)
+        slowest = sorted(self.timings.items(), key=lambda kv: -kv[1])
+        for package, elapsed in slowest[:SLOWEST_PACKAGES]:
+            self.log_func(f"[INFO] {package}: {elapsed:.1f} с")
+
+
+def run_apt(args, log_func, env=None):
+    """
+    Запускает apt-get args с потоковым выводом.
+    Прогресс берется из APT::Status-Fd, stderr (W:/E:) пишется в лог сразу.
+    Возвращает (returncode, хвост stdout, хвост stderr).
+    """
+    progress = AptProgress(log_func)
+    r, w = os.pipe()
+
+    def on_line(kind, line):
+        if kind == "status":
+            progress.feed(line)
+        elif kind == "err" and line.strip():
+            log_func(f"[APT] {line}")
+
+    try:
+        result = stream_cmd(
+            ["apt-get", "-o", f"APT::Status-Fd={w}"] + list(args),
+            on_line, env=env, pass_fds=(w,), extra={"status": r})
+    except OSError:
+        os.close(r)
+        raise
+    progress.finish()
+    return result
+
+
+def _file_uri_path(uri):
+    """Путь из file:/x, file:///x, file://localhost/x; None — не file:."""
+    if not uri.startswith("file:"):
+        return None
+    path = uri[len("file:"):]
+    if path.startswith("//"):
+        host, _, rest = path[2:].partition("/")
+        if host not in ("", "localhost"):
+            return None
+        path = "/" + rest
+    return os.path.normpath(path)
+
+
+def _deb_uri(parts):
+    """URI из строки deb [опции] uri suite ...; None — строка не deb."""
+    if not parts or parts[0] != "deb":
+        return None
+    rest = parts[1:]
+    if rest and rest[0].startswith("["):
+        # Блок опций: [a=b], [a=b c=d] или [ a=b ] — до токена с «]»
+        while rest and "]" not in rest[0]:
+            rest = rest[1:]
+        head = rest[0].split("]", 1)[1] if rest else ""
+        rest = ([head] if head else []) + rest[1:]
+    return rest[0] if rest else None
+
+
+def local_source_lines(repo: Path = REPO_DIR):
+    """Строки deb для file:<repo> из sources.list и sources.list.d."""
+    target = os.path.normpath(str(repo))
+    lines = []
+    files = [SOURCES_LIST] + sorted(SOURCES_PARTS.glob("*.list"))
+    for path in files:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    parts = line.split("#", 1)[0].split()
+                    uri = _deb_uri(parts)
+                    if uri and _file_uri_path(uri) == target:
+                        lines.append(" ".join(parts))
+        except OSError:
+            continue
+    return sorted(set(lines))
+
+
+def release_source_lines(repo: Path = REPO_DIR):
+    """Строки deb для file:<repo>, собранные из Suite и Components Release."""
+    url = f"file:{repo}"
+    lines = []
+    for release in sorted(repo.glob("dists/*/Release")):
+        fields = {}
+        with open(release, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                key, sep, value = line.partition(":")
+                if sep and not line.startswith(" "):
+                    fields[key] = value.strip()
+        components = fields.get("Components", "main")
+        lines.append(f"deb {url} {release.parent.name} {components}")
+    return lines
+
+
+def release_fingerprint(repo: Path, sources):
+    """sha256 по всем dists/*/Release, InRelease и строкам источника."""
+    h = hashlib.sha256()
+    for line in sources:
+        h.update(line.encode("utf-8") + b"\n")
+    names = glob.glob(str(repo / "dists" / "*" / "Release")) + \
+        glob.glob(str(repo / "dists" / "*" / "InRelease"))
+    for name in sorted(names):
+        h.update(name.encode("utf-8") + b"\0")
+        with open(name, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _lists_present(repo: Path):
+    prefix = str(repo).strip("/").replace("/", "_") + "_"
+    return any(APT_LISTS.glob(f"_{prefix}*"))
+
+
+def update_local_repo(log_func, repo: Path = REPO_DIR, force=False):
+    """
+    apt-get update только по локальному источнику file:<repo>.
+    Сетевые источники из sources.list.d не опрашиваются. Если отпечаток
+    Release совпадает с сохраненным и списки пакетов на месте, update
+    пропускается. Возвращает код возврата (0 при пропуске).
+    """
+    sources = local_source_lines(repo)
+    if not sources:
+        sources = release_source_lines(repo)
+        if not sources:
+            log_func(f"[WARN] В {repo}/dists нет Release, локальный update невозможен")
+            return 1
+        # Без записи в sources.list.d apt-get install не увидит пакеты
+        LOCAL_LIST.write_text("\n".join(sources) + "\n", encoding="utf-8")
+        log_func(f"[INFO] Источник {repo} добавлен в {LOCAL_LIST}")
+    fingerprint = release_fingerprint(repo, sources)
+    stamp = repo / FINGERPRINT_NAME
+    try:
+        saved = stamp.read_text(encoding="utf-8").strip()
+    except OSError:
+        saved = None
+    if not force and saved == fingerprint and _lists_present(repo):
+        log_func(f"[OK] {repo} не изменился, apt update пропущен")
+        return 0
+
+    fd, tmp = tempfile.mkstemp(prefix="astra-local-", suffix=".list")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("\n".join(sources) + "\n")
+        rc, _, err = run_apt(
+            ["-o", f"Dir::Etc::sourcelist={tmp}",
+             "-o", "Dir::Etc::sourceparts=-",
+             "-o", "APT::Get::List-Cleanup=0",
+             "update"], log_func)
+    finally:
+        os.unlink(tmp)
+    if rc == 0:
+        stamp.write_text(fingerprint + "\n", encoding="utf-8")
+    return rc
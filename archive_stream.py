@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковая распаковка tar-архивов любого сжатия: .tar, .tar.gz/.tgz,
+.tar.xz/.txz, .tar.zst/.tzst.
+
+Архив никогда не читается в память целиком: распакованный поток идет в
+tarfile в режиме "r|" и разбирается по одному элементу. Распаковку
+сжатия по возможности выполняет отдельный процесс (zstd -T0, xz -T0,
+pigz) — он работает на других ядрах параллельно с записью файлов. Без
+него используются модули zstandard, lzma или gzip. Дескриптор архива
+общий с процессом-распаковщиком, поэтому позиция в нем показывает,
+сколько сжатых байт обработано, — по ней считаются прогресс и скорость.
+"""
+import os
+import gzip
+import lzma
+import time
+import shutil
+import tarfile
+import subprocess
+
+from cmd_stream import tracked
+from copy_engine import Progress, PROGRESS_INTERVAL
+
+PIPE_BUFSIZE = 1024 * 1024
+
+# Суффиксы проверяются по порядку, составные — раньше простых
+SUFFIXES = (
+    (".tar.zst", "zst"), (".tzst", "zst"),
+    (".tar.xz", "xz"), (".txz", "xz"),
+    (".tar.gz", "gz"), (".tgz", "gz"),
+    (".tar", "tar"),
+    (".zip", "zip"),
+)
+ARCHIVE_FILTER = ("Archives (*.zip *.tar *.tar.gz *.tgz *.tar.xz *.txz "
+                  "*.tar.zst *.tzst)")
+
+DECODERS = {
+    "zst": (["zstd", "-T0", "-dc"],),
+    "xz": (["xz", "-T0", "-dc"],),
+    "gz": (["pigz", "-dc"],),
+}
+
+
+def archive_kind(path):
+    """Тип архива по имени: zst, xz, gz, tar, zip или None."""
+    name = str(path).lower()
+    for suffix, kind in SUFFIXES:
+        if name.endswith(suffix):
+            return kind
+    return None
+
+
+def archive_stem(path):
+    """Имя архива без суффикса формата: proj.tar.zst -> proj."""
+    name = os.path.basename(str(path))
+    for suffix, _kind in SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def _decoder(kind):
+    for cmd in DECODERS.get(kind, ()):
+        if shutil.which(cmd[0]):
+            return cmd
+    return None
+
+
+def _module_reader(kind, f):
+    if kind == "zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise OSError("Для .tar.zst нужен zstd или модуль zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(f)
+    if kind == "xz":
+        return lzma.open(f, "rb")
+    if kind == "gz":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    return f
+
+
+class TarStream:
+    """
+    Контекст потокового чтения tar-архива:
+
+        with TarStream(path) as stream:
+            for member in stream.members(progress):
+                stream.tar.extract(member, dest)
+    """
+
+    def __init__(self, path, kind=None):
+        self.path = path
+        self.kind = kind or archive_kind(path)
+        self.size = os.path.getsize(path)
+        self.tar = None
+        self._file = None
+        self._reader = None
+        self._proc = None
+        self._tracked = None
+        self._cmd = None
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        try:
+            self._cmd = _decoder(self.kind)
+            if self._cmd:
+                self._proc = subprocess.Popen(
+                    self._cmd, stdin=self._file, stdout=subprocess.PIPE,
+                    bufsize=PIPE_BUFSIZE)
+                self._tracked = tracked(self._proc)
+                self._tracked.__enter__()
+                self._reader = self._proc.stdout
+            else:
+                self._reader = _module_reader(self.kind, self._file)
+            self.tar = tarfile.open(fileobj=self._reader, mode="r|",
+                                    bufsize=PIPE_BUFSIZE)
+        except BaseException:
+            self._close(True)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._close(exc_type is not None)
+        return False
+
+    def _close(self, failed):
+        if self.tar is not None:
+            self.tar.close()
+        if self._proc is not None:
+            if failed:
+                self._proc.kill()
+            else:
+                # tar заканчивается раньше потока (выравнивание блоков),
+                # дочитываем остаток, чтобы распаковщик не получил SIGPIPE
+                while self._proc.stdout.read(PIPE_BUFSIZE):
+                    pass
+            self._proc.stdout.close()
+            rc = self._proc.wait()
+            self._tracked.__exit__(None, None, None)
+            if rc != 0 and not failed:
+                raise OSError(f"{self._cmd[0]}: код возврата {rc}")
+        elif self._reader is not None and self._reader is not self._file:
+            self._reader.close()
+        self._file.close()
+
+    def position(self):
+        """Сколько байт сжатого архива уже прочитано."""
+        return os.lseek(self._file.fileno(), 0, os.SEEK_CUR)
+
+    def members(self, progress: Progress = None):
+        """Элементы архива по порядку; раз в PROGRESS_INTERVAL — прогресс."""
+        last = time.monotonic()
+        for member in self.tar:
+            yield member
+            if progress and time.monotonic() - last >= PROGRESS_INTERVAL:
+                last = time.monotonic()
+                progress.done = self.position()
+                progress.report()
+        if progress:
+            progress.done = self.size
+
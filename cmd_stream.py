@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковый запуск внешних команд.
+
+stdout и stderr читаются построчно отдельными потоками и передаются в
+обработчик on_line в вызывающем потоке сразу по мере появления. В памяти
+держится только ограниченный хвост вывода и ограниченная очередь строк.
+Запущенные процессы регистрируются, чтобы отмена задачи могла их завершить.
+"""
+import os
+import queue
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+
+TAIL_LINES = 200
+QUEUE_LINES = 1000
+MAX_LINE = 64 * 1024
+
+_children = set()
+_children_lock = threading.Lock()
+
+
+@contextmanager
+def tracked(proc):
+    """Регистрирует subprocess.Popen, чтобы отмена могла его завершить."""
+    with _children_lock:
+        _children.add(proc)
+    try:
+        yield proc
+    finally:
+        with _children_lock:
+            _children.discard(proc)
+
+
+def terminate_children():
+    with _children_lock:
+        procs = list(_children)
+    for proc in procs:
+        try:
+            proc.terminate()
+        except OSError:
+            pass
+
+
+def _pump(stream, kind, q):
+    try:
+        for raw in iter(lambda: stream.readline(MAX_LINE), b""):
+            q.put((kind, raw.decode("utf-8", "replace").rstrip("\r\n")))
+    finally:
+        stream.close()
+        q.put((kind, None))
+
+
+def stream_cmd(cmd, on_line=None, env=None, cwd=None, input_text=None,
+               tail=TAIL_LINES, pass_fds=(), extra=None):
+    """
+    Запускает cmd и вызывает on_line(kind, line) для каждой строки,
+    kind — "out", "err" или ключ из extra.
+    extra — {kind: fd} дополнительных каналов чтения (например APT::Status-Fd);
+    pass_fds передаются процессу и закрываются в родителе после запуска.
+    Возвращает (returncode, хвост stdout, хвост stderr).
+    """
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input_text else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            pass_fds=tuple(pass_fds),
+        )
+    finally:
+        for fd in pass_fds:
+            os.close(fd)
+
+    q = queue.Queue(maxsize=QUEUE_LINES)
+    streams = {"out": proc.stdout, "err": proc.stderr}
+    for kind, fd in (extra or {}).items():
+        streams[kind] = os.fdopen(fd, "rb")
+    tails = {kind: deque(maxlen=tail) for kind in streams}
+    for kind, stream in streams.items():
+        threading.Thread(target=_pump, args=(stream, kind, q), daemon=True).start()
+
+    if input_text:
+        def feed():
+            try:
+                proc.stdin.write(input_text.encode("utf-8"))
+                proc.stdin.close()
+            except OSError:
+                pass
+        threading.Thread(target=feed, daemon=True).start()
+
+    open_streams = len(streams)
+    with tracked(proc):
+        try:
+            while open_streams:
+                kind, line = q.get()
+                if line is None:
+                    open_streams -= 1
+                    continue
+                tails[kind].append(line)
+                if on_line:
+                    on_line(kind, line)
+        except BaseException:
+            # Обработчик прервал чтение (например отмена): завершаем процесс
+            # и дочитываем каналы, чтобы потоки чтения не зависли на очереди
+            proc.kill()
+            while open_streams:
+                if q.get()[1] is None:
+                    open_streams -= 1
+            proc.wait()
+            raise
+        rc = proc.wait()
+    return rc, "\n".join(tails["out"]), "\n".join(tails["err"])
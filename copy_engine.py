@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий движок копирования файлов и деревьев каталогов.
+
+Файлы копируются параллельно пулом потоков; внутри файла используется
+копирование на стороне ядра (copy_file_range/sendfile), а при недоступности —
+чтение/запись большими блоками. Прогресс (байты и МБ/с) выводится через
+log_func из вызывающего потока, поэтому log_func может писать в виджет Qt.
+"""
+import os
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+COPY_WORKERS = min(8, (os.cpu_count() or 2) * 2)
+BUFSIZE = 4 * 1024 * 1024
+CHUNK = 16 * 1024 * 1024
+PROGRESS_INTERVAL = 2.0
+
+
+def fmt_size(n):
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "Б" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} ГБ"
+
+
+class Progress:
+    """Потокобезопасный счетчик скопированных байт со скоростью."""
+
+    def __init__(self, log_func=None, total=0, label="Копирование"):
+        self.log_func = log_func
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.files = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+
+    def file_done(self):
+        with self._lock:
+            self.files += 1
+
+    def rate(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return self.done / elapsed
+
+    def report(self):
+        if not self.log_func:
+            return
+        total = f" из {fmt_size(self.total)}" if self.total else ""
+        self.log_func(f"[INFO] {self.label}: {fmt_size(self.done)}{total}, "
+                      f"{fmt_size(self.rate())}/с")
+
+    def finish(self):
+        if not self.log_func:
+            return
+        self.log_func(
+            f"[OK] {self.label}: {self.files} файлов, {fmt_size(self.done)} "
+            f"за {time.monotonic() - self.started:.1f} с "
+            f"({fmt_size(self.rate())}/с)")
+
+
+def _kernel_copy(fin, fout, size, progress):
+    """Копирует size байт средствами ядра. Возвращает False, если не вышло."""
+    in_fd, out_fd = fin.fileno(), fout.fileno()
+    copied = 0
+    func = getattr(os, "copy_file_range", None)
+    while copied < size:
+        try:
+            if func is not None:
+                n = func(in_fd, out_fd, min(CHUNK, size - copied))
+            else:
+                n = os.sendfile(out_fd, in_fd, copied, min(CHUNK, size - copied))
+        except OSError:
+            if copied == 0 and func is not None:
+                # copy_file_range не поддерживается (старое ядро, другая ФС)
+                func = None
+                continue
+            if copied == 0:
+                return False
+            raise
+        if n == 0:
+            break
+        copied += n
+        if progress:
+            progress.add(n)
+    return True
+
+
+def _buffered_copy(fin, fout, progress, hasher=None):
+    buf = bytearray(BUFSIZE)
+    view = memoryview(buf)
+    while True:
+        n = fin.readinto(buf)
+        if not n:
+            break
+        if hasher is not None:
+            hasher.update(view[:n])
+        fout.write(view[:n])
+        if progress:
+            progress.add(n)
+
+
+def copy_file(src, dst, progress=None, hashed=False, atomic=False):
+    """
+    Копирует src в dst с сохранением прав и времени (как shutil.copy2).
+    hashed=True — считает sha256 при копировании и возвращает его.
+    atomic=True — пишет во временный dst.part и переименовывает в конце.
+    """
+    src, dst = os.fspath(src), os.fspath(dst)
+    target = dst + ".part" if atomic else dst
+    hasher = hashlib.sha256() if hashed else None
+    with open(src, "rb") as fin, open(target, "wb") as fout:
+        if hasher is not None or \
+                not _kernel_copy(fin, fout, os.fstat(fin.fileno()).st_size, progress):
+            _buffered_copy(fin, fout, progress, hasher)
+    shutil.copystat(src, target)
+    if atomic:
+        os.replace(target, dst)
+    if progress:
+        progress.file_done()
+    return hasher.hexdigest() if hasher is not None else None
+
+
+def copy_many(pairs, workers=None, progress=None, hashed=False, atomic=False):
+    """
+    Копирует список пар (src, dst) в пуле потоков.
+    Возвращает список результатов copy_file в порядке pairs.
+    Ошибки собираются и выбрасываются одним shutil.Error в конце.
+    """
+    pairs = list(pairs)
+    results = [None] * len(pairs)
+    errors = []
+    if not pairs:
+        return results
+    with ThreadPoolExecutor(max_workers=workers or COPY_WORKERS) as pool:
+        futures = {
+            pool.submit(copy_file, src, dst, progress, hashed, atomic): i
+            for i, (src, dst) in enumerate(pairs)}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=PROGRESS_INTERVAL,
+                                     return_when=FIRST_EXCEPTION)
+                for fut in done:
+                    i = futures[fut]
+                    try:
+                        results[i] = fut.result()
+                    except OSError as e:
+                        errors.append(
+                            (str(pairs[i][0]), str(pairs[i][1]), str(e)))
+                if pending and progress:
+                    progress.report()
+        except BaseException:
+            # Отмена задачи: не ждем копирования оставшихся файлов
+            for fut in pending:
+                fut.cancel()
+            raise
+    if errors:
+        raise shutil.Error(errors)
+    return results
+
+
+def copytree(src, dst, workers=None, log_func=None, label=None):
+    """
+    Параллельная замена shutil.copytree: каталоги создаются сразу,
+    файлы копируются пулом потоков. dst может уже существовать.
+    Возвращает (число файлов, число байт).
+    """
+    src, dst = os.fspath(src), os.fspath(dst)
+    pairs = []
+    dirs = []
+    total = 0
+    for root, _dirnames, files in os.walk(src, followlinks=True):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        dirs.append((root, target_root))
+        for name in files:
+            path = os.path.join(root, name)
+            total += os.stat(path).st_size
+            pairs.append((path, os.path.join(target_root, name)))
+
+    progress = Progress(log_func, total, label or f"Копирование {src}")
+    copy_many(pairs, workers, progress)
+    for s, d in reversed(dirs):
+        shutil.copystat(s, d)
+    progress.finish()
+    return len(pairs), total
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Развертывание отдельных файлов без запуска cp/chown/chmod.
+
+Файл пишется во временный файл в каталоге назначения, ему выставляются
+владелец и режим, затем он атомарно переименовывается поверх старого.
+Если содержимое назначения уже совпадает, копирование пропускается и
+исправляются только режим и владелец.
+"""
+import os
+import shutil
+import filecmp
+import tempfile
+from pathlib import Path
+
+from copy_engine import copy_file
+
+SAME, CREATED, UPDATED = "same", "created", "updated"
+
+
+def _fix_attrs(path, mode, uid, gid):
+    st = os.stat(path)
+    if uid is not None and (st.st_uid, st.st_gid) != (uid, gid):
+        os.chown(path, uid, gid)
+    if mode is not None and (st.st_mode & 0o7777) != mode:
+        os.chmod(path, mode)
+
+
+def deploy_file(src, dst, mode=None, uid=None, gid=None, backup=False):
+    """
+    Копирует src в dst через временный файл и rename.
+    backup=True сохраняет прежний dst как dst.<suffix>.bak перед заменой.
+    Возвращает SAME, CREATED или UPDATED.
+    """
+    src, dst = Path(src), Path(dst)
+    try:
+        st = dst.stat()
+    except FileNotFoundError:
+        st = None
+    if st is not None and st.st_size == src.stat().st_size \
+            and filecmp.cmp(src, dst, shallow=False):
+        _fix_attrs(dst, mode, uid, gid)
+        return SAME
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if backup and st is not None:
+        shutil.copy2(dst, dst.with_suffix(dst.suffix + ".bak"))
+    fd, tmp = tempfile.mkstemp(prefix=f".{dst.name}.", dir=str(dst.parent))
+    os.close(fd)
+    try:
+        copy_file(src, tmp)
+        if uid is not None:
+            os.chown(tmp, uid, gid)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return CREATED if st is None else UPDATED
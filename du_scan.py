@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Подсчет занятого места по каталогам (замена du -hs) на os.scandir.
+
+Деревья обходятся пулом потоков: каждый подкаталог верхнего уровня —
+отдельная задача. Для каждого каталога запоминаются сумма и число его
+собственных файлов, список подкаталогов и самые большие файлы. Пока
+mtime каталога не изменился (файлы в нем не добавлялись, не удалялись и
+не переименовывались), файлы в нем заново не перебираются — проверяется
+только mtime подкаталогов.
+
+Файл может расти на месте, не меняя mtime каталога (логи, базы в
+/var/lib). Поэтому запись кэша используется, только если самый свежий
+файл каталога старше CACHE_MIN_AGE, а VOLATILE_PREFIXES (например
+/var/log) читаются всегда. Размеры, взятые из кэша, отмечаются в отчете
+(cached_bytes). Место считается по выделенным блокам, как у du; жесткие
+ссылки не склеиваются.
+
+Запуск: python3 du_scan.py [каталог ...]
+"""
+import os
+import sys
+import json
+import glob
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from copy_engine import fmt_size
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_PATH = BASE_DIR / "Logs" / "du_cache.json"
+SCAN_WORKERS = 8
+TOP_FILES = 20
+DU_ROOTS = ("/var", "/home", "/opt", "/opt/repo")
+VOLATILE_PREFIXES = ("/var/log", "/var/tmp", "/var/spool", "/tmp")
+# Каталог с файлами моложе этого (с) из кэша не берется
+CACHE_MIN_AGE = 7 * 24 * 3600
+
+
+def _volatile(path):
+    return any(path == p or path.startswith(p + "/") for p in VOLATILE_PREFIXES)
+
+
+def _read_dir(path, mtime_ns, top_n):
+    """
+    Собственные файлы каталога: запись кэша {m, b, n, d, t, r} и ошибки;
+    r — mtime самого свежего файла.
+    """
+    size = count = newest = 0
+    subdirs, top, errors = [], [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    errors.append(f"{entry.path}: {e.strerror}")
+                    continue
+                used = st.st_blocks * 512
+                newest = max(newest, st.st_mtime_ns)
+                size += used
+                count += 1
+                if len(top) < top_n:
+                    heapq.heappush(top, (used, entry.name))
+                elif used > top[0][0]:
+                    heapq.heapreplace(top, (used, entry.name))
+    except OSError as e:
+        errors.append(f"{path}: {e.strerror}")
+    return {"m": mtime_ns, "b": size, "n": count, "d": sorted(subdirs),
+            "t": [[name, used] for used, name in top], "r": newest}, errors
+
+
+def _reusable(entry, path, mtime_ns, fresh_ns):
+    return (entry is not None and entry["m"] == mtime_ns
+            and entry.get("r", fresh_ns) < fresh_ns and not _volatile(path))
+
+
+def _scan_unit(root, cache, top_n, deadline=None):
+    """
+    Обходит дерево root. Возвращает ({каталог: (размер поддерева, из них
+    из кэша)}, {каталог: запись кэша}, самые большие файлы, ошибки,
+    прочитано, из кэша). После deadline выбрасывает TimeoutError.
+    """
+    entries, own, from_cache, errors = {}, {}, {}, []
+    read = cached = 0
+    fresh_ns = time.time_ns() - CACHE_MIN_AGE * 10**9
+    stack = [root]
+    order = []
+    while stack:
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"{root}: не уложились в срок")
+        path = stack.pop()
+        try:
+            st = os.lstat(path)
+        except OSError as e:
+            errors.append(f"{path}: {e.strerror}")
+            continue
+        entry = cache.get(path)
+        if _reusable(entry, path, st.st_mtime_ns, fresh_ns):
+            cached += 1
+            from_cache[path] = entry["b"]
+        else:
+            entry, errs = _read_dir(path, st.st_mtime_ns, top_n)
+            errors += errs
+            read += 1
+            from_cache[path] = 0
+        entries[path] = entry
+        # Блоки самого каталога du тоже учитывает
+        own[path] = st.st_blocks * 512
+        order.append(path)
+        stack.extend(os.path.join(path, name) for name in entry["d"])
+
+    totals = {}
+    for path in reversed(order):
+        entry = entries[path]
+        size, cached_size = own[path] + entry["b"], from_cache[path]
+        for name in entry["d"]:
+            sub, sub_cached = totals.get(os.path.join(path, name), (0, 0))
+            size += sub
+            cached_size += sub_cached
+        totals[path] = (size, cached_size)
+    top = heapq.nlargest(top_n, (
+        (used, os.path.join(path, name))
+        for path, entry in entries.items() for name, used in entry["t"]))
+    return totals, entries, top, errors, read, cached
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def scan(roots=DU_ROOTS, workers=SCAN_WORKERS, top_n=TOP_FILES,
+         cache_path=CACHE_PATH, deadline=None):
+    """
+    Размеры элементов roots/* (как du -hs root/*) и top_n самых больших
+    файлов. Возвращает словарь, пригодный для json. Если к deadline
+    (time.monotonic) обход не закончен, выбрасывает TimeoutError, кэш не
+    сохраняется.
+    """
+    started = time.monotonic()
+    cache = load_cache(cache_path) if cache_path else {}
+    items = []
+    for root in roots:
+        items += sorted(glob.glob(os.path.join(root, "*")))
+    # Вложенные корни (/opt/repo внутри /opt) обходятся один раз
+    dirs = [p for p in dict.fromkeys(items)
+            if os.path.isdir(p) and not os.path.islink(p)]
+    units = [p for p in dirs if not any(p.startswith(d + "/") for d in dirs)]
+
+    totals, new_cache, top, errors = {}, {}, [], []
+    read = cached = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for t, entries, unit_top, errs, r, c in pool.map(
+                lambda u: _scan_unit(u, cache, top_n, deadline), units):
+            totals.update(t)
+            new_cache.update(entries)
+            top += unit_top
+            errors += errs
+            read += r
+            cached += c
+    if cache_path:
+        try:
+            save_cache(new_cache, cache_path)
+        except OSError as e:
+            errors.append(f"{cache_path}: {e.strerror}")
+
+    sizes = []
+    for path in items:
+        if path in totals:
+            used, cached_used = totals[path]
+        else:
+            try:
+                used, cached_used = os.lstat(path).st_blocks * 512, 0
+            except OSError:
+                continue
+        sizes.append({"path": path, "bytes": used, "cached_bytes": cached_used})
+    return {
+        "entries": sizes,
+        "top_files": [{"path": p, "bytes": b}
+                      for b, p in heapq.nlargest(top_n, top)],
+        "dirs_read": read,
+        "dirs_cached": cached,
+        "errors": errors,
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+
+
+def format_report(result):
+    """
+    Текст в духе du -hs и список самых больших файлов. У размеров, часть
+    которых взята из кэша, в скобках указано, какая.
+    """
+    lines = []
+    for e in result["entries"]:
+        line = f"{fmt_size(e['bytes'])}\t{e['path']}"
+        if e["cached_bytes"]:
+            line += f"\t(из кэша {fmt_size(e['cached_bytes'])})"
+        lines.append(line)
+    lines += ["", f"Самые большие файлы ({len(result['top_files'])}):"]
+    lines += [f"{fmt_size(f['bytes'])}\t{f['path']}" for f in result["top_files"]]
+    lines += ["", f"Каталогов прочитано {result['dirs_read']}, из кэша "
+                  f"{result['dirs_cached']}, за {result['elapsed_s']:.1f} с"]
+    if result["errors"]:
+        lines.append(f"Ошибок доступа: {len(result['errors'])}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_report(scan(sys.argv[1:] or DU_ROOTS)))
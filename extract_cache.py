@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш распаковок Int.zip по содержимому архива.
+
+Каждая распаковка лежит в CACHE_ROOT/int_<sha256[:16]> и используется
+повторно, пока архив не изменился. sha256 архива запоминается по
+(размер, mtime), чтобы не перечитывать многогигабайтный zip при каждом
+запуске. Общий размер кэша ограничен CACHE_LIMIT: самые давно
+использованные распаковки удаляются (LRU), включая старые каталоги
+int_<дата>_<время> от прежних версий программы.
+"""
+import os
+import re
+import json
+import time
+import shutil
+from pathlib import Path
+
+from repo_sync import file_sha256
+
+CACHE_ROOT = Path("/home/adminib/Distr")
+CACHE_LIMIT = 20 * 1024 * 1024 * 1024
+INDEX_NAME = ".int_cache.json"
+COMPLETE_MARK = ".complete"
+LEGACY_RE = re.compile(r"^int_\d{8}_\d{6}$")
+
+
+class ExtractCache:
+    """Каталог распаковок с индексом {digest: {dir, size, last_used}}."""
+
+    def __init__(self, root: Path = CACHE_ROOT, limit=CACHE_LIMIT):
+        self.root = Path(root)
+        self.limit = limit
+        self.index_path = self.root / INDEX_NAME
+        self.entries = {}
+        self.hashes = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+            self.hashes = data.get("hashes", {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_name(INDEX_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries, "hashes": self.hashes}, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def digest(self, zip_path: Path):
+        """sha256 архива; пересчитывается только при смене размера или mtime."""
+        st = zip_path.stat()
+        key = str(zip_path)
+        memo = self.hashes.get(key)
+        if memo and memo["size"] == st.st_size and memo["mtime_ns"] == st.st_mtime_ns:
+            return memo["sha256"]
+        digest = file_sha256(zip_path)
+        self.hashes[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                            "sha256": digest}
+        return digest
+
+    def path_for(self, digest):
+        return self.root / f"int_{digest[:16]}"
+
+    def lookup(self, digest):
+        """Готовая распаковка или None; отмечает использование."""
+        path = self.path_for(digest)
+        if digest in self.entries and (path / COMPLETE_MARK).exists():
+            self.entries[digest]["last_used"] = time.time()
+            return path
+        return None
+
+    def prepare(self, digest):
+        """Пустой каталог для новой распаковки (остатки прерванной удаляются)."""
+        dest = self.path_for(digest)
+        if dest.exists():
+            shutil.rmtree(dest)
+        dest.mkdir(parents=True)
+        return dest
+
+    def commit(self, digest, size, log_func):
+        """Отмечает распаковку готовой, чистит кэш по LRU и сохраняет индекс."""
+        self.mark_complete(digest, size)
+        self.evict(digest, log_func)
+        self.save()
+
+    def mark_complete(self, digest, size):
+        path = self.path_for(digest)
+        (path / COMPLETE_MARK).touch()
+        self.entries[digest] = {"dir": path.name, "size": size,
+                                "last_used": time.time()}
+
+    def evict(self, keep, log_func):
+        """Удаляет старые распаковки, пока кэш больше limit. keep не трогает."""
+        candidates = []
+        for digest, entry in self.entries.items():
+            if digest != keep:
+                candidates.append((entry["last_used"], entry["size"],
+                                   self.root / entry["dir"], digest))
+        if self.root.exists():
+            for p in self.root.iterdir():
+                if p.is_dir() and LEGACY_RE.match(p.name):
+                    size = sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+                    candidates.append((p.stat().st_mtime, size, p, None))
+        total = sum(c[1] for c in candidates) + \
+            self.entries.get(keep, {}).get("size", 0)
+        for _last_used, size, path, digest in sorted(candidates, key=lambda c: c[0]):
+            if total <= self.limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            if digest is not None:
+                self.entries.pop(digest, None)
+            total -= size
+            log_func(f"[INFO] Удалена старая распаковка {path}")
+
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индекс имен файлов распакованного дистрибутива Integrity.
+
+Дерево обходится один раз через os.scandir, и строится словарь
+{имя файла: [относительные пути]}. Все поиски в perform_flow идут по
+индексу, а не через rglob. Индекс сохраняется в каталоге распаковки
+рядом с отметкой кэша и при повторном использовании читается с диска.
+"""
+import os
+import json
+import posixpath
+from pathlib import Path
+
+INDEX_NAME = ".file_index.json"
+
+
+class FileIndex:
+    def __init__(self, root, files):
+        self.root = Path(root)
+        self.files = files
+
+    @classmethod
+    def build(cls, root):
+        """Один обход дерева os.scandir."""
+        files = {}
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                it = os.scandir(os.path.join(root, rel_dir))
+            except OSError:
+                continue
+            with it:
+                entries = sorted(it, key=lambda e: e.name)
+            for entry in entries:
+                rel = posixpath.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                elif rel_dir or entry.name != INDEX_NAME:
+                    files.setdefault(entry.name, []).append(rel)
+        return cls(root, files)
+
+    @classmethod
+    def from_names(cls, root, names):
+        """Индекс по списку элементов архива (пути совпадают с распакованными)."""
+        files = {}
+        for name in names:
+            if not name.endswith("/"):
+                files.setdefault(posixpath.basename(name), []).append(name)
+        return cls(root, files)
+
+    @classmethod
+    def load(cls, root):
+        try:
+            with open(Path(root) / INDEX_NAME, "r", encoding="utf-8") as f:
+                return cls(root, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def save(self):
+        tmp = self.root / (INDEX_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.files, f, ensure_ascii=False)
+        os.replace(tmp, self.root / INDEX_NAME)
+
+    def find(self, name, preferred=None):
+        """Первый файл с данным именем; preferred — желаемый путь-суффикс."""
+        rels = self.files.get(name, [])
+        if preferred:
+            for rel in rels:
+                if rel == preferred or rel.endswith("/" + preferred):
+                    return self.root / rel
+        return self.root / rels[0] if rels else None
+
+
+def index_for(root):
+    """Сохраненный индекс каталога или новый (с сохранением)."""
+    index = FileIndex.load(root)
+    if index is None:
+        index = FileIndex.build(root)
+        try:
+            index.save()
+        except OSError:
+            pass
+    return index
@@ -6,23 +6,32 @@ Astra Admin Tool — установка из /var/AstraAdminTool/Distr/Int.zip
 import sys
 import os
 import shutil
-import subprocess
-import zipfile
-import tarfile
 import time
 from pathlib import Path
 from datetime import datetime
 
+from project_deploy import deploy_tree, deploy_archive, rollback, saved_projects
+from archive_stream import ARCHIVE_FILTER, archive_stem
+from applog import get_log, level_of, install_crash_hooks
+from profiling import RunProfile
+from cmd_stream import stream_cmd
+from extract_cache import ExtractCache
+from zip_extract import ZipPlan, StagedExtraction
+from file_index import FileIndex, index_for
+
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QTextEdit, QMessageBox,
-    QCheckBox, QVBoxLayout, QLabel, QHBoxLayout, QFileDialog
+    QCheckBox, QVBoxLayout, QLabel, QHBoxLayout, QFileDialog, QInputDialog
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, QEventLoop, pyqtSignal
 
 APP_TITLE = "Astra Admin Tool"
 
 BASE_DIR = Path(__file__).resolve().parent
 LOG_FILE = BASE_DIR / "log_integrity.txt"
+# Сколько строк держит окно лога; полный вывод остается в LOG_FILE
+LOG_MAX_BLOCKS = 5000
+PROFILE_DIR = BASE_DIR / "Logs" / "profiles"
 
 # ← фиксированное местоположение Int.zip
 ZIP_PATH = Path("/var/AstraAdminTool/Distr/Int.zip")
@@ -34,6 +43,8 @@ CLIENTSEC_NAME = "clientsecurity"
 PROJECTS_ROOT = Path("/Integrity/Projects")
 ENVCTRL_DIR = Path("/var/IntegrityEnvCtrl")
 SHARE_PREFIX = Path("/share")
+INSTALLER_NAME = "IntegrityInstaller.sh"
+INSTALLER_PATH = "IntegrityInstallerLinux/IntegrityInstaller.sh"
 
 #утилита
 
@@ -41,14 +52,17 @@ def now_str():
     return datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
 
 
+# Число строк [ERR] в логе: по нему шаг отмечается в профиле как неудачный
+error_lines = 0
+
+
 def append_log(widget, msg):
+    global error_lines
     line = f"{now_str()} {msg}"
+    if level_of(msg) == "ERR":
+        error_lines += 1
     widget.append(line)
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
-    except Exception:
-        pass
+    get_log(LOG_FILE).write(line)
 
 
 def is_root():
@@ -57,25 +71,74 @@ def is_root():
     return True
 
 
+class CmdThread(QThread):
+    """Запуск команды в отдельном потоке; строки вывода — сигналом line."""
+    line = pyqtSignal(str)
+
+    def __init__(self, cmd, cwd=None, env=None):
+        super().__init__()
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+        self.rc = 1
+
+    def run(self):
+        def on_line(kind, line):
+            self.line.emit(f"[{kind.upper()}] {line}")
+
+        try:
+            self.rc, _, _ = stream_cmd(self.cmd, on_line, cwd=self.cwd, env=self.env)
+        except Exception as e:
+            self.line.emit(f"[ERR] запуск команды: {e}")
+            self.rc = 1
+
+
+class FuncThread(QThread):
+    """Вызов func(log_func) в отдельном потоке; строки лога — сигналом line."""
+    line = pyqtSignal(str)
+
+    def __init__(self, func):
+        super().__init__()
+        self.func = func
+        self.error = None
+
+    def run(self):
+        try:
+            self.func(self.line.emit)
+        except Exception as e:
+            self.error = e
+
+
+def _wait_thread(widget, thread):
+    """Запускает thread и крутит локальный цикл событий до его завершения."""
+    loop = QEventLoop()
+    thread.line.connect(lambda line: append_log(widget, line))
+    thread.finished.connect(loop.quit)
+    thread.start()
+    loop.exec_()
+    thread.wait()
+
+
 def run_cmd(widget, cmd, cwd=None, env=None):
+    """
+    Выполняет команду, выводя строки в лог по мере появления. Пока она
+    работает, крутится локальный цикл событий, и окно не зависает.
+    """
     append_log(widget, f"[CMD] {' '.join(cmd)}")
-    try:
-        proc = subprocess.run(
-            cmd,
-            cwd=cwd,
-            env=env,
-            capture_output=True,
-            text=True)
-    except Exception as e:
-        append_log(widget, f"[ERR] запуск команды: {e}")
-        return 1
-    if proc.stdout:
-        for ln in proc.stdout.splitlines():
-            append_log(widget, f"[OUT] {ln}")
-    if proc.stderr:
-        for ln in proc.stderr.splitlines():
-            append_log(widget, f"[ERR] {ln}")
-    return proc.returncode
+    thread = CmdThread(cmd, cwd, env)
+    _wait_thread(widget, thread)
+    return thread.rc
+
+
+def run_in_thread(widget, func):
+    """
+    Выполняет func(log_func) в отдельном потоке, как run_cmd: лог и
+    прогресс выводятся по мере появления. Исключение func пробрасывается.
+    """
+    thread = FuncThread(func)
+    _wait_thread(widget, thread)
+    if thread.error is not None:
+        raise thread.error
 
 
 def safe_mkdir(path: Path):
@@ -111,15 +174,23 @@ class App(QWidget):
         btn_layout = QHBoxLayout()
         self.run_button = QPushButton("Выполнить выбранные задачи")
         btn_layout.addWidget(self.run_button)
+        self.rollback_button = QPushButton("Откатить проект")
+        btn_layout.addWidget(self.rollback_button)
         main.addLayout(btn_layout)
 
+        # Фоновая распаковка Int.zip и индекс имен файлов распаковки
+        self.pending = None
+        self.index = None
+
         self.log_box = QTextEdit()
         self.log_box.setReadOnly(True)
         self.log_box.setFixedHeight(360)
+        self.log_box.document().setMaximumBlockCount(LOG_MAX_BLOCKS)
         main.addWidget(self.log_box)
 
         # self.check_all.stateChanged.connect(self.toggle_all)
         self.run_button.clicked.connect(self.run_selected)
+        self.rollback_button.clicked.connect(self.rollback_project)
 
         # clear log
         try:
@@ -141,25 +212,34 @@ class App(QWidget):
         self.cb_server_sv.setChecked(val)
 
     def run_selected(self):
-        tasks = []
-        if self.cb_api.isChecked():
-            tasks.append(("API", self.on_api))
-        if self.cb_arm.isChecked():
-            tasks.append(("ARM", self.on_arm))
-        if self.cb_server.isChecked():
-            tasks.append(("Server", self.on_server))
-        if self.cb_server_sv.isChecked():
-            tasks.append(("Server_sv", self.on_server))
-        if not tasks:
+        roles = [name for name, cb in (
+            ("API", self.cb_api),
+            ("ARM", self.cb_arm),
+            ("Server", self.cb_server),
+            ("Server_sv", self.cb_server_sv)) if cb.isChecked()]
+        if not roles:
             append_log(self.log_box, "[WARN] Задачи не выбраны")
             return
-        for name, fn in tasks:
-            append_log(self.log_box, f"[TASK] Начало: {name}")
-            try:
-                fn()
-            except Exception as e:
-                append_log(self.log_box, f"[ERR] Исключение: {e}")
-            append_log(self.log_box, f"[TASK] Завершено: {name}")
+        # Все роли ставятся одним установщиком: шаги выполняются один раз
+        # независимо от числа выбранных ролей
+        append_log(self.log_box, f"[TASK] Роли: {', '.join(roles)}")
+        # Во время установки крутится локальный цикл событий — повторный
+        # запуск до завершения недопустим
+        self.run_button.setEnabled(False)
+        profile = RunProfile("integrity")
+        try:
+            self.perform_flow(profile)
+        except Exception as e:
+            append_log(self.log_box, f"[ERR] Исключение: {e}")
+        finally:
+            self.run_button.setEnabled(True)
+        for line in profile.table():
+            append_log(self.log_box, line)
+        try:
+            append_log(self.log_box,
+                       f"[INFO] Профиль сохранен: {profile.save(PROFILE_DIR)}")
+        except OSError as e:
+            append_log(self.log_box, f"[WARN] Профиль не сохранен: {e}")
         QMessageBox.information(
             self, APP_TITLE, "Все выбранные задачи завершены")
 
@@ -168,26 +248,68 @@ class App(QWidget):
         if not ZIP_PATH.exists():
             append_log(self.log_box, f"[ERR] Int.zip не найден: {ZIP_PATH}")
             return None
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dest_root = Path("/home/adminib/Distr")
-        dest = dest_root / f"int_{ts}"
+        self.index = None
         try:
-            safe_mkdir(dest)
+            # Распаковка берется из кэша, если Int.zip не менялся
+            cache = ExtractCache()
+            digest = cache.digest(ZIP_PATH)
+            found = cache.lookup(digest)
+            if found:
+                cache.save()
+                append_log(self.log_box,
+                           f"[OK] Int.zip не изменился, используется {found}")
+                self.index = index_for(found)
+                return found
+
+            # По центральному каталогу находим нужные файлы и распаковываем
+            # сначала их (каталог установщика целиком), остальное — в фоне
+            plan = ZipPlan(ZIP_PATH)
+            dest = cache.prepare(digest)
+            self.index = FileIndex.from_names(dest, plan.names)
+            first = []
+            installer = plan.find(INSTALLER_NAME, INSTALLER_PATH)
+            if installer:
+                first += plan.under(installer)
+            for name in REQUIRED_JSONS + [CLIENTSEC_NAME]:
+                member = plan.find(name)
+                if member:
+                    first.append(member)
             append_log(self.log_box, f"[INFO] Распаковка {ZIP_PATH} -> {dest}")
-            with zipfile.ZipFile(ZIP_PATH, "r") as z:
-                z.extractall(dest)
+            staged = StagedExtraction(plan, dest, first)
+            staged.start()
+            self.pending = (cache, digest, staged)
             return dest
         except Exception as e:
             append_log(self.log_box, f"[ERR] Ошибка распаковки: {e}")
             return None
 
+    def finish_extraction(self):
+        """Дожидается фоновой распаковки и фиксирует её в кэше."""
+        if self.pending is None:
+            return
+        cache, digest, staged = self.pending
+        self.pending = None
+
+        def finish(log_func):
+            size = staged.wait()
+            self.index.save()
+            cache.commit(digest, size, log_func)
+
+        try:
+            # Ожидание в отдельном потоке: окно не замирает до конца распаковки
+            run_in_thread(self.log_box, finish)
+            append_log(self.log_box, "[OK] Распаковка Int.zip завершена")
+        except Exception as e:
+            append_log(self.log_box, f"[ERR] Ошибка распаковки: {e}")
+
+    def find_file(self, folder: Path, name, preferred=None):
+        """Поиск по индексу распаковки (строится один раз на каталог)."""
+        if self.index is None or self.index.root != folder:
+            self.index = index_for(folder)
+        return self.index.find(name, preferred)
+
     def find_installer(self, folder: Path):
-        candidate = folder / "IntegrityInstallerLinux" / "IntegrityInstaller.sh"
-        if candidate.exists():
-            return candidate
-        for p in folder.rglob("IntegrityInstaller.sh"):
-            return p
-        return None
+        return self.find_file(folder, INSTALLER_NAME, INSTALLER_PATH)
 
     def run_installer(self, path: Path):
         try:
@@ -204,11 +326,10 @@ class App(QWidget):
     def copy_jsons(self, folder: Path):
         safe_mkdir(ENVCTRL_DIR)
         for name in REQUIRED_JSONS:
-            found = list(folder.rglob(name))
-            if not found:
+            src = self.find_file(folder, name)
+            if src is None:
                 append_log(self.log_box, f"[WARN] {name} не найден")
                 continue
-            src = found[0]
             dst = ENVCTRL_DIR / name
             try:
                 shutil.copy2(src, dst)
@@ -219,11 +340,10 @@ class App(QWidget):
                     f"[ERR] Не удалось скопировать {name}: {e}")
 
     def copy_clientsecurity(self, folder: Path):
-        found = list(folder.rglob(CLIENTSEC_NAME))
-        if not found:
+        src = self.find_file(folder, CLIENTSEC_NAME)
+        if src is None:
             append_log(self.log_box, f"[WARN] {CLIENTSEC_NAME} не найден")
             return
-        src = found[0]
         targets = sorted(SHARE_PREFIX.glob("IntegrityClientSecurity-*"))
         for t in targets:
             d = t / "data"
@@ -251,51 +371,87 @@ class App(QWidget):
                 self, "Папка проекта", str(folder))
             if not src:
                 return
-            dst = PROJECTS_ROOT / Path(src).name
-            if dst.exists():
-                shutil.rmtree(dst)
-            shutil.copytree(src, dst)
-            append_log(self.log_box, f"[OK] Проект скопирован -> {dst}")
+            run_in_thread(self.log_box, lambda log: deploy_tree(
+                src, PROJECTS_ROOT, Path(src).name, log))
         elif clicked == btn_archive:
             path, _ = QFileDialog.getOpenFileName(self, "Архив проекта", str(folder),
-                                                  "Archives (*.zip *.tar *.tar.gz *.tgz)")
+                                                  ARCHIVE_FILTER)
             if not path:
                 return
-            dst = PROJECTS_ROOT / Path(path).stem
-            if dst.exists():
-                shutil.rmtree(dst)
-            safe_mkdir(dst)
             try:
-                if path.endswith(".zip"):
-                    with zipfile.ZipFile(path, "r") as z:
-                        z.extractall(dst)
-                else:
-                    with tarfile.open(path, "r:*") as t:
-                        t.extractall(dst)
-                append_log(self.log_box, f"[OK] Архив распакован -> {dst}")
+                run_in_thread(self.log_box, lambda log: deploy_archive(
+                    path, PROJECTS_ROOT, archive_stem(path), log))
             except Exception as e:
                 append_log(
                     self.log_box,
                     f"[ERR] Ошибка распаковки проекта: {e}")
 
-    def perform_flow(self):
-        folder = self.extract_zip()
+    def rollback_project(self):
+        """Возвращает проект к последней сохраненной версии."""
+        names = saved_projects(PROJECTS_ROOT)
+        if not names:
+            append_log(self.log_box, "[WARN] Нет проектов с сохраненными версиями")
+            return
+        name, ok = QInputDialog.getItem(
+            self, "Откат проекта", "Проект:", names, 0, False)
+        if not ok:
+            return
+        self.rollback_button.setEnabled(False)
+        try:
+            run_in_thread(self.log_box,
+                          lambda log: rollback(PROJECTS_ROOT, name, log))
+        except Exception as e:
+            append_log(self.log_box, f"[ERR] Ошибка отката проекта: {e}")
+        finally:
+            self.rollback_button.setEnabled(True)
+
+    def shared_steps(self, folder: Path):
+        """Шаги установки, общие для всех ролей: выполняются один раз за запуск."""
+        def installer():
+            path = self.find_installer(folder)
+            if path:
+                self.run_installer(path)
+            else:
+                append_log(self.log_box, f"[WARN] {INSTALLER_NAME} не найден")
+
+        def project():
+            # Для выбора проекта нужен весь архив
+            self.finish_extraction()
+            self.deploy_project(folder)
+
+        return [
+            ("Установщик", installer),
+            ("Конфигурация", lambda: self.copy_jsons(folder)),
+            ("clientsecurity", lambda: self.copy_clientsecurity(folder)),
+            ("Проект", project),
+        ]
+
+    def perform_flow(self, profile=None):
+        profile = profile or RunProfile("integrity")
+        with profile.measure("Распаковка Int.zip"):
+            folder = self.extract_zip()
         if not folder:
             return
-        installer = self.find_installer(folder)
-        if installer:
-            self.run_installer(installer)
-        self.copy_jsons(folder)
-        self.copy_clientsecurity(folder)
-        self.deploy_project(folder)
-
-    def on_api(self): self.perform_flow()
-    def on_arm(self): self.perform_flow()
-    def on_server(self): self.perform_flow()
+        for name, fn in self.shared_steps(folder):
+            append_log(self.log_box, f"[TASK] Начало: {name}")
+            started = time.monotonic()
+            try:
+                with profile.measure(name) as measured:
+                    errors = error_lines
+                    fn()
+                    if error_lines != errors:
+                        measured.fail()
+            except Exception as e:
+                append_log(self.log_box, f"[ERR] Исключение: {e}")
+            append_log(self.log_box, f"[TASK] Завершено: {name} "
+                                     f"({time.monotonic() - started:.1f} с)")
+        with profile.measure("Завершение распаковки"):
+            self.finish_extraction()
 
 
 # ---------------- Run ----------------
 if __name__ == "__main__":
+    install_crash_hooks()
     app = QApplication(sys.argv)
     w = App()
     w.show()
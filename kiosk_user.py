@@ -8,6 +8,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Tuple
 
+from applog import get_log, install_crash_hooks
+
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QListWidget, QInputDialog, QMessageBox,
@@ -68,14 +70,8 @@ def read_passwd_user(uid_min: int = UID_MIN) -> List[Dict]:
 
 def append_log(text: str) -> None:
     now = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-    line = f"{now} {text}\n"
-    try:
-        LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(line)
-    except Exception:
-        # Best-effort: if logging to file fails, ignore so UI stays responsive
-        pass
+    # Written by a background thread in batches; errors are ignored there
+    get_log(LOG_FILE).write(f"{now} {text}")
 
 
 # --- GUI ---
@@ -328,4 +324,5 @@ def main():
 
 
 if __name__ == '__main__':
+    install_crash_hooks()
     main()
@@ -4,11 +4,22 @@ import sys
 import os
 import shutil
 import subprocess
-import json
+from datetime import datetime
 from pathlib import Path
+from repo_sync import sync_repo, REPO_DIR
+from repo_verify import verify_repo
+from media import find_media, has_repo, wait_for_media
+from copy_engine import copytree
+from task_runner import TaskWorker, check_cancelled
+from cmd_stream import stream_cmd, tracked
+from apt_tools import run_apt, update_local_repo
+from scheduler import Task
+from manifest import load_plan, ManifestError, SECTIONS
+from deploy import deploy_file, SAME
+from applog import get_log, install_crash_hooks
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QTextEdit, QMessageBox,
-    QInputDialog, QVBoxLayout, QCheckBox, QHBoxLayout
+    QInputDialog, QVBoxLayout, QCheckBox, QHBoxLayout, QProgressBar, QLabel
 )
 
 APP_TITLE = "Astra Admin Tool"
@@ -17,21 +28,29 @@ BASE_DIR = Path(__file__).resolve().parent
 DISTR_DIR = BASE_DIR / "Distr"
 MANIFEST = DISTR_DIR / "manifest.json"
 TOOL_DIR = "/var/AstraAdminTool"
+MEDIA_WAIT = 120  # сколько ждать флешку с репозитарием, с
 LOG_FILE = BASE_DIR / "log.txt"
+PROFILE_DIR = BASE_DIR / "Logs" / "profiles"
+# Секции manifest.json, которые копирует задача
+TASK_SECTIONS = {
+    "xorg": ("files",),
+    "sources": ("files_sl",),
+    "el": ("kiosk", "el"),
+}
 
 
 # Вспомогательные функции
-def run_cmd(cmd, input_text=None, env=None):
-    proc = subprocess.Popen(
-        cmd,
-        stdin=subprocess.PIPE if input_text else None,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        env=env
-    )
-    out, err = proc.communicate(input_text)
-    return proc.returncode, out, err
+def run_cmd(cmd, input_text=None, env=None, log_func=None):
+    """
+    Запускает команду с потоковым чтением вывода.
+    Если задан log_func, строки пишутся в лог сразу по мере появления.
+    Возвращает (код, хвост stdout, хвост stderr).
+    """
+    def on_line(kind, line):
+        log_func(f"[{kind.upper()}] {line}")
+
+    return stream_cmd(cmd, on_line if log_func else None,
+                      env=env, input_text=input_text)
 
 
 def is_root():
@@ -45,76 +64,42 @@ def find_flash_with_dists_pool():
     Ищет флешку с папками dists и pool.
     Возвращает путь к корню флешки, если найдены обе папки, иначе None.
     """
-    try:
-        result = subprocess.run(
-            ["lsblk", "-o", "NAME,RM,MOUNTPOINT", "-nr"],
-            stdout=subprocess.PIPE, text=True, check=True
-        )
-    except subprocess.CalledProcessError:
-        return None
-
-    for line in result.stdout.splitlines():
-        parts = line.split(None, 2)
-        if len(parts) < 3:
-            continue
-        name, rm, mount = parts[0], parts[1], parts[2]
-        if rm == "1" and mount != "":
-            root = Path(mount)
-            dists_path = root / "dists"
-            pool_path = root / "pool"
-            if dists_path.exists() and pool_path.exists():
-                return root  # флешка найдена
-    return None
+    return find_media(has_repo)
 
 
-def ensure_parent(path: Path):
-    path.parent.mkdir(parents=True, exist_ok=True)
+def deploy_action(action, log_func):
+    had_dst = action.dst.exists()
+    status = deploy_file(action.src, action.dst, action.mode,
+                         action.uid, action.gid, action.backup)
+    if status == SAME:
+        log_func(f"[OK] {action.dst} без изменений")
+        return
+    if action.backup and had_dst:
+        log_func(f"[OK] Backup {action.dst}")
+    log_func(f"[OK] {action.src} → {action.dst}")
 
 
-def copy_files(files, log_func):
-    for entry in files:
-        src = DISTR_DIR / entry["src"]
-        dst = Path(entry["dst"])
+def copy_files(actions, log_func):
+    """Копирует файлы по записям скомпилированного манифеста (manifest.Action)."""
+    for action in actions:
+        src, dst = action.src, action.dst
         if not src.exists():
             log_func(f"[WARN] Нет исходного файла: {src}")
             continue
         try:
-            ensure_parent(dst)
-            if entry.get("backup", True) and dst.exists():
-                shutil.copy2(dst, dst.with_suffix(dst.suffix + ".bak"))
-                log_func(f"[OK] Backup {dst}")
-            shutil.copy2(src, dst)
-            log_func(f"[OK] {src} → {dst}")
-            if "mode" in entry:
-                os.chmod(dst, int(entry["mode"], 8))
-            if "owner" in entry:
-                rc, _, err = run_cmd(["chown", entry["owner"], str(dst)])
-                if rc != 0:
-                    log_func(f"[WARN] chown: {err.strip()}")
+            deploy_action(action, log_func)
         except Exception as e:
             log_func(f"[ERR] {src} → {dst}: {e}")
 
 
-def copy_files_sl(files_sl, log_func):
-    for entry in files_sl:
-        src = DISTR_DIR / entry["src"]
-        dst = Path(entry["dst"])
+def copy_files_sl(actions, log_func):
+    for action in actions:
+        src, dst = action.src, action.dst
         if not src.exists():
             log_func(f"[WARN] Нет исходного файла: {src}")
             continue
         try:
-            ensure_parent(dst)
-            if entry.get("backup", True) and dst.exists():
-                shutil.copy2(dst, dst.with_suffix(dst.suffix + ".bak"))
-                log_func(f"[OK] Backup {dst}")
-            shutil.copy2(src, dst)
-            log_func(f"[OK] {src} → {dst}")
-            if "mode" in entry:
-                os.chmod(dst, int(entry["mode"], 8))
-            if "owner" in entry:
-                rc, _, err = run_cmd(["chown", entry["owner"], str(dst)])
-                if rc != 0:
-                    log_func(f"[WARN] chown: {err.strip()}")
+            deploy_action(action, log_func)
         except Exception as e:
             log_func(f"[ERR] {src} → {dst}: {e}")
 
@@ -130,7 +115,7 @@ def setup_chrony(log_func):
         # Установка chrony в неинтерактивном режиме
         env = os.environ.copy()
         env["DEBIAN_FRONTEND"] = "noninteractive"
-        rc, out, err = run_cmd(["apt", "-y", "install", "chrony"], env=env)
+        rc, out, err = run_apt(["-y", "install", "chrony"], log_func, env=env)
         if rc == 0:
             log_func("[OK] chrony установлен")
         else:
@@ -157,10 +142,17 @@ def setup_chrony(log_func):
         log_func(f"[ERR] chrony: {e}")
 
 
-def run_apt_update(log_func):
+def run_apt_update(log_func, local_only=True):
+    """
+    apt update. По умолчанию обновляется только локальный источник
+    file:/opt/repo, и update пропускается, если репозитарий не менялся.
+    """
     log_func("[TASK] Выполняется apt update...")
     try:
-        rc, _, err = run_cmd(["apt", "update"])
+        if local_only:
+            rc, err = update_local_repo(log_func, REPO_DIR), ""
+        else:
+            rc, _, err = run_apt(["update"], log_func)
         if rc == 0:
             log_func("[OK] apt update завершен")
         else:
@@ -169,8 +161,16 @@ def run_apt_update(log_func):
         log_func(f"[ERR] apt update: {e}")
 
 
-def copy_folders(usb_path, log_func):
-    dst_repo = Path("/opt/repo")
+def copy_folders(usb_path, log_func, incremental=True):
+    """
+    Копирует dists и pool с флешки в /opt/repo.
+    В инкрементальном режиме копируются только изменившиеся файлы (repo_sync),
+    иначе /opt/repo удаляется и копируется заново.
+    """
+    dst_repo = REPO_DIR
+    if incremental:
+        sync_repo(usb_path, log_func, dst_repo)
+        return
     folders = ["dists", "pool"]
     if dst_repo.exists():
         shutil.rmtree(dst_repo)
@@ -181,7 +181,7 @@ def copy_folders(usb_path, log_func):
         src_folder = usb_path / folder_name
         dst_folder = dst_repo / folder_name
         if src_folder.exists():
-            shutil.copytree(src_folder, dst_folder)
+            copytree(src_folder, dst_folder, log_func=log_func)
             log_func(f"[OK] Папка {folder_name} скопирована в {dst_folder}")
         else:
             log_func(f"[WARN] Папка {folder_name} не найдена на флешке")
@@ -201,22 +201,24 @@ def copy_block(log_func):
             if file_path.is_file():
                 dst_file = dst_dir / file_path.name
                 try:
-                    subprocess.run(
-                        ["cp", str(file_path), str(dst_file)], check=True)
-                    subprocess.run(
-                        ["chown", "root:root", str(dst_file)], check=True)
-                    subprocess.run(["chmod", "644", str(dst_file)], check=True)
+                    # root:root, 0644
+                    if deploy_file(file_path, dst_file, 0o644, 0, 0) != SAME:
+                        log_func(f"[OK] {file_path} → {dst_file}")
                 except Exception as e:
                     log_func(f"[ERR] Ошибка: {e}")
 
 
+def run_manifest_section(section, log_func):
+    """Выполняет секцию манифеста (diff печатает кнопка dry-run)."""
+    plan = load_plan(MANIFEST, sections=(section,))
+    copy_files(plan.section(section), log_func)
+
+
 # Обработчики
 def on_copy(log_func):
     log_func("[TASK] Копирование файлов...")
     try:
-        with MANIFEST.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        copy_files(data.get("files", []), log_func)
+        run_manifest_section("files", log_func)
         log_func("[DONE]")
     except Exception as e:
         log_func(f"[ERR] Ошибка: {e}")
@@ -225,9 +227,7 @@ def on_copy(log_func):
 def on_copy_sl(log_func):
     log_func("[TASK] Копирование файлов...")
     try:
-        with MANIFEST.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        copy_files(data.get("files_sl", []), log_func)
+        run_manifest_section("files_sl", log_func)
         log_func("[DONE]")
     except Exception as e:
         log_func(f"[ERR] Ошибка: {e}")
@@ -236,10 +236,23 @@ def on_copy_sl(log_func):
 def on_repo(log_func):
     log_func("[TASK] Поиск флешки и копирование папок в /opt/repo")
     usb_root = find_flash_with_dists_pool()
+    if not usb_root:
+        log_func(f"[INFO] Вставьте флешку с dists и pool, ожидание {MEDIA_WAIT} с...")
+        ticks = [0]
+
+        def tick():
+            # Отмена проверяется каждую секунду, в лог — раз в 10 с
+            check_cancelled()
+            ticks[0] += 1
+            if ticks[0] % 10 == 0:
+                log_func(f"[INFO] Ожидание флешки... {ticks[0]} с")
+
+        usb_root = wait_for_media(has_repo, MEDIA_WAIT, tick=tick)
     if usb_root:
         log_func(f"[INFO] Флешка найдена: {usb_root}")
         copy_folders(usb_root, log_func)
         log_func("[DONE] Копирование папок завершено")
+        verify_repo(REPO_DIR, log_func)
     else:
         log_func("[WARN] Флешка с папками dists и pool не найдена")
 
@@ -251,11 +264,10 @@ def on_apt_update(log_func):
 def on_user(log_func):
     log_func("[TASK]Запуск программы настройки пользователей...")
     try:
-        # приостановить main.py
-        rc = subprocess.run(
-            ["python3", str(BASE_DIR / "kiosk_user.py")],
-            check=False
-        ).returncode
+        # ждём завершения программы настройки пользователей
+        with tracked(subprocess.Popen(
+                ["python3", str(BASE_DIR / "kiosk_user.py")])) as proc:
+            rc = proc.wait()
 
         if rc == 0:
             log_func("[OK] программа завершина")
@@ -283,9 +295,7 @@ def on_chrony(log_func):
 def on_kiosk(log_func):
     log_func("[TASK] Настройка блокировки киоска...")
     try:
-        with MANIFEST.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        copy_files(data.get("kiosk", []), log_func)
+        run_manifest_section("kiosk", log_func)
         log_func("[DONE]")
     except Exception as e:
         log_func(f"[ERR] Ошибка: {e}")
@@ -294,9 +304,7 @@ def on_kiosk(log_func):
 def on_el(log_func):
     log_func("[TASK] Настройка энергосбережения...")
     try:
-        with MANIFEST.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        copy_files(data.get("el", []), log_func)
+        run_manifest_section("el", log_func)
         log_func("[DONE]")
     except Exception as e:
         log_func(f"[ERR] Ошибка: {e}")
@@ -314,11 +322,10 @@ def on_block(log_func):
 def on_int(log_func):
     log_func("[TASK]Запуск установки интегрити...")
     try:
-        # приостановить main.py
-        rc = subprocess.run(
-            ["python3", str(BASE_DIR / "integ.py")],
-            check=False
-        ).returncode
+        # ждём завершения установки интегрити
+        with tracked(subprocess.Popen(
+                ["python3", str(BASE_DIR / "integ.py")])) as proc:
+            rc = proc.wait()
 
         if rc == 0:
             log_func("[OK] программа завершина")
@@ -363,18 +370,28 @@ class App(QWidget):
         self.check_all = QCheckBox("Выполнить все задачи")
         layout.addWidget(self.check_all)
 
-        # Список чекбоксов
+        # Список чекбоксов и задач.
+        # deps — задачи, которые должны завершиться раньше (если выбраны),
+        # locks — общие ресурсы: apt/dpkg и интерактивные окна не пересекаются
         self.checkboxes = [
-            (QCheckBox("Блокировка консоли X11\n(xorg.conf)"), on_copy),
-            (QCheckBox("Коприовать список источников пакетов\n(sources.list)"), on_copy_sl),
-            (QCheckBox("Настроить репозитарий (/opt/repo) \nОбновить список пакетов"), on_all_repo),
-            (QCheckBox("Создать пользователя киоска \n(с указанием имени и пароля)"), on_user),
-            (QCheckBox("Настроить систему точного времени \n(Chrony)"), on_chrony),
+            (QCheckBox("Блокировка консоли X11\n(xorg.conf)"),
+             Task("xorg", on_copy)),
+            (QCheckBox("Коприовать список источников пакетов\n(sources.list)"),
+             Task("sources", on_copy_sl)),
+            (QCheckBox("Настроить репозитарий (/opt/repo) \nОбновить список пакетов"),
+             Task("repo", on_all_repo, deps=("sources",), locks=("apt",))),
+            (QCheckBox("Создать пользователя киоска \n(с указанием имени и пароля)"),
+             Task("user", on_user, locks=("gui",))),
+            (QCheckBox("Настроить систему точного времени \n(Chrony)"),
+             Task("chrony", on_chrony, deps=("repo",), locks=("apt",))),
             (QCheckBox(
-                "Снять блокировку экрана \n(Киоск, потухание и блокировка экрана)"), on_all_el),
-            (QCheckBox("Запустить установку Integrity \n(IntegrityInstaller.sh)"), on_int)
+                "Снять блокировку экрана \n(Киоск, потухание и блокировка экрана)"),
+             Task("el", on_all_el)),
+            (QCheckBox("Запустить установку Integrity \n(IntegrityInstaller.sh)"),
+             Task("int", on_int, locks=("gui", "apt")))
         ]
-        for cb, _ in self.checkboxes:
+        for cb, task in self.checkboxes:
+            task.name = cb.text().split("\n")[0].strip()
             layout.addWidget(cb)
 
         # --- Логика синхронизации галки "Выбрать все" ---
@@ -382,8 +399,23 @@ class App(QWidget):
             cb.stateChanged.connect(self.update_check_all_state)
 
         # Кнопка выполнить все
+        run_layout = QHBoxLayout()
         self.run_button = QPushButton("Выполнить выбранные задачи")
-        layout.addWidget(self.run_button)
+        self.stop_button = QPushButton("Остановить")
+        self.stop_button.setEnabled(False)
+        self.plan_button = QPushButton("Проверить (dry-run)")
+        run_layout.addWidget(self.run_button)
+        run_layout.addWidget(self.stop_button)
+        run_layout.addWidget(self.plan_button)
+        layout.addLayout(run_layout)
+
+        # Прогресс выполнения задач
+        self.status_label = QLabel("")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.progress_bar)
+        self.worker = None
 
         # Лог
         self.log_box = QTextEdit()
@@ -402,6 +434,8 @@ class App(QWidget):
         # Подключения
         self.check_all.stateChanged.connect(self.toggle_all)
         self.run_button.clicked.connect(self.run_selected)
+        self.stop_button.clicked.connect(self.stop_selected)
+        self.plan_button.clicked.connect(self.show_plan)
         self.back_button.clicked.connect(self.go_back)
         self.cancel_button.clicked.connect(self.cancel_app)
 
@@ -425,20 +459,108 @@ class App(QWidget):
         self.check_all.blockSignals(False)
 
     # --- Остальные методы остаются без изменений ---
-    def log(self, msg):
+    def log(self, msg, task=None):
+        msg = f"{datetime.now().strftime('[%Y-%m-%d %H:%M:%S]')} {msg}"
         self.log_box.append(msg)
+        log_file = get_log(LOG_FILE)
+        log_file.write(msg, task or None)
+        if log_file.error is not None:
+            self.log_box.append(f"[ERR] Ошибка записи в лог: {log_file.error}")
+            log_file.error = None
+
+    def check_manifest(self, sections=SECTIONS):
+        """
+        Проверяет секции манифеста; при ошибках выводит их все и
+        возвращает None.
+        """
         try:
-            with open(LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(msg + "\n")
+            return load_plan(MANIFEST, sections=sections)
+        except ManifestError as e:
+            for problem in e.problems:
+                self.log(f"[ERR] manifest.json: {problem}")
         except Exception as e:
-            self.log_box.append(f"[ERR] Ошибка записи в лог: {e}")
+            self.log(f"[ERR] manifest.json: {e}")
+        QMessageBox.critical(self, APP_TITLE, "Ошибка в manifest.json, см. лог")
+        return None
+
+    def show_plan(self):
+        plan = self.check_manifest()
+        if plan is not None:
+            for line in plan.diff_lines():
+                self.log(line)
 
     def run_selected(self):
+        if self.worker is not None:
+            return
+        tasks = [
+            task for cb, task in self.checkboxes
+            if self.check_all.isChecked() or cb.isChecked()]
+        # Проверяются только секции манифеста выбранных задач
+        sections = [s for t in tasks for s in TASK_SECTIONS.get(t.key, ())]
+        if sections and self.check_manifest(sections) is None:
+            return
         self.log("[TASK] Запуск выбранных задач...")
-        for cb, func in self.checkboxes:
-            if self.check_all.isChecked() or cb.isChecked():
-                func(self.log)
-        self.log("[DONE] Все выбранные задачи выполнены")
+        self.progress_bar.setRange(0, max(len(tasks), 1))
+        self.progress_bar.setValue(0)
+        self.running_tasks = []
+
+        # Задачи выполняются в фоновом потоке (независимые — параллельно),
+        # лог приходит сигналами
+        self.worker = TaskWorker(tasks, self)
+        self.worker.line.connect(self.log)
+        self.worker.task_started.connect(self.on_task_started)
+        self.worker.task_finished.connect(self.on_task_finished)
+        self.worker.task_skipped.connect(self.on_task_skipped)
+        self.worker.all_finished.connect(self.on_all_finished)
+        self.run_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.worker.start()
+
+    def stop_selected(self):
+        if self.worker is not None:
+            self.log("[CANCEL] Остановка задач...")
+            self.stop_button.setEnabled(False)
+            self.worker.cancel()
+
+    def update_status(self):
+        self.status_label.setText(
+            f"Выполнено {self.progress_bar.value()}/{len(self.worker.tasks)}, "
+            f"выполняется: {', '.join(self.running_tasks)}")
+
+    def on_task_started(self, name):
+        self.running_tasks.append(name)
+        self.update_status()
+
+    def on_task_finished(self, name, elapsed):
+        self.running_tasks.remove(name)
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+        self.log(f"[INFO] {name}: {elapsed:.1f} с")
+        self.update_status()
+
+    def on_task_skipped(self, name):
+        # Пропущенная задача тоже засчитывается, иначе после ошибки
+        # индикатор не доходит до конца; [WARN] уже записал планировщик
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+        self.update_status()
+
+    def on_all_finished(self, cancelled):
+        if cancelled:
+            self.log("[CANCEL] Выполнение задач остановлено")
+            self.status_label.setText("Остановлено")
+        else:
+            self.log("[DONE] Все выбранные задачи выполнены")
+            self.status_label.setText("Готово")
+        self.worker.wait()
+        profile = self.worker.profile
+        for line in profile.table():
+            self.log(line)
+        try:
+            self.log(f"[INFO] Профиль сохранен: {profile.save(PROFILE_DIR)}")
+        except OSError as e:
+            self.log(f"[WARN] Профиль не сохранен: {e}")
+        self.worker = None
+        self.run_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
 
     def go_back(self):
         self.log("[INFO] Возврат в start.py...")
@@ -455,6 +577,9 @@ class App(QWidget):
         )
         if reply == QMessageBox.Yes:
             self.log(f"[INFO] Удаление {TOOL_DIR}...")
+            # Лог лежит внутри TOOL_DIR: дописываем его до удаления, чтобы
+            # фоновая запись не пересоздала файл во время rmtree
+            get_log(LOG_FILE).flush()
             try:
                 shutil.rmtree(TOOL_DIR)
                 self.log("[OK] Папка удалена")
@@ -469,6 +594,7 @@ class App(QWidget):
 
 # ---------------- Запуск ----------------
 if __name__ == "__main__":
+    install_crash_hooks()
     app = QApplication(sys.argv)
     window = App()
     window.show()
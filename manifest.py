@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компилятор Distr/manifest.json в план копирования.
+
+Разбор манифеста (поля, абсолютный dst, режим) кэшируется по sha256
+содержимого. Наличие исходных файлов и владельцев проверяется заново при
+каждой загрузке — они зависят от состояния диска, а не от манифеста.
+Проверяются только запрошенные секции, ошибки собираются все сразу до
+того, как что-либо будет записано на диск. План умеет печатать dry-run
+diff.
+
+Запуск `python3 manifest.py` печатает diff без изменений на диске.
+"""
+import sys
+import pwd
+import grp
+import json
+import hashlib
+import filecmp
+import threading
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DISTR_DIR = BASE_DIR / "Distr"
+MANIFEST = DISTR_DIR / "manifest.json"
+SECTIONS = ("files", "files_sl", "kiosk", "el")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class ManifestError(Exception):
+    """Манифест не прошел проверку; problems — список всех ошибок."""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+class Action:
+    """Одна запись манифеста с разрешенными путями, режимом и владельцем."""
+
+    def __init__(self, section, src, dst, backup, mode, owner, uid, gid):
+        self.section = section
+        self.src = src
+        self.dst = dst
+        self.backup = backup
+        self.mode = mode
+        self.owner = owner
+        self.uid = uid
+        self.gid = gid
+
+    def diff(self):
+        """Возвращает (метка, описание, байт к записи) для текущего состояния диска."""
+        size = self.src.stat().st_size
+        try:
+            st = self.dst.stat()
+        except FileNotFoundError:
+            return "+", f"{self.dst} (новый, {size} байт)", size
+        notes = []
+        same = st.st_size == size and filecmp.cmp(self.src, self.dst, shallow=False)
+        if not same:
+            notes.append(f"содержимое {st.st_size} → {size} байт")
+        if self.mode is not None and (st.st_mode & 0o7777) != self.mode:
+            notes.append(f"режим {st.st_mode & 0o7777:04o} → {self.mode:04o}")
+        if self.uid is not None and (st.st_uid, st.st_gid) != (self.uid, self.gid):
+            notes.append(f"владелец {st.st_uid}:{st.st_gid} → {self.owner}")
+        if not notes:
+            return "=", f"{self.dst} (без изменений)", 0
+        return "~", f"{self.dst} ({', '.join(notes)})", 0 if same else size
+
+
+class Plan:
+    """Скомпилированный манифест: списки Action и ошибки разбора по секциям."""
+
+    def __init__(self, digest, sections, problems=None):
+        self.digest = digest
+        self.sections = sections
+        self.problems = problems or {}
+
+    def section(self, name):
+        return self.sections.get(name, [])
+
+    def check(self, names=SECTIONS):
+        """
+        Ошибки секций names: разбора и текущего состояния (нет исходного
+        файла, неизвестный владелец). Заодно разрешает uid/gid владельцев.
+        """
+        problems = []
+        for name in names:
+            problems += self.problems.get(name, [])
+            for i, action in enumerate(self.section(name)):
+                where = f"{name}[{i}]"
+                if not action.src.is_file():
+                    problems.append(f"{where}: нет исходного файла {action.src}")
+                if action.owner is not None:
+                    action.uid, action.gid = _parse_owner(
+                        action.owner, problems, where)
+        return problems
+
+    def diff_lines(self, names=SECTIONS):
+        lines = []
+        total = 0
+        for name in names:
+            for action in self.section(name):
+                mark, text, size = action.diff()
+                total += size
+                lines.append(f"[PLAN] {mark} [{name}] {action.src.name} → {text}")
+        lines.append(f"[PLAN] Всего к записи: {total} байт")
+        return lines
+
+
+def _parse_owner(owner, problems, where):
+    user, _, group = owner.partition(":")
+    try:
+        pw = pwd.getpwnam(user)
+        uid = pw.pw_uid
+        gid = grp.getgrnam(group).gr_gid if group else pw.pw_gid
+        return uid, gid
+    except KeyError:
+        problems.append(f"{where}: неизвестный владелец {owner!r}")
+        return None, None
+
+
+def compile_manifest(data, digest, distr_dir=DISTR_DIR):
+    """Разбор манифеста без обращения к диску; ошибки — по секциям."""
+    sections = {}
+    section_problems = {}
+    for name in SECTIONS:
+        problems = section_problems[name] = []
+        entries = data.get(name, [])
+        if not isinstance(entries, list):
+            problems.append(f"{name}: ожидается список")
+            continue
+        actions = []
+        for i, entry in enumerate(entries):
+            where = f"{name}[{i}]"
+            if not isinstance(entry, dict) or "src" not in entry or "dst" not in entry:
+                problems.append(f"{where}: нужны поля src и dst")
+                continue
+            src = distr_dir / entry["src"]
+            dst = Path(entry["dst"])
+            if not dst.is_absolute():
+                problems.append(f"{where}: dst должен быть абсолютным путем")
+            mode = None
+            if "mode" in entry:
+                try:
+                    mode = int(str(entry["mode"]), 8)
+                    if not 0 <= mode <= 0o7777:
+                        raise ValueError
+                except ValueError:
+                    problems.append(f"{where}: неверный mode {entry['mode']!r}")
+            actions.append(Action(name, src, dst, bool(entry.get("backup", True)),
+                                  mode, entry.get("owner"), None, None))
+        sections[name] = actions
+    return Plan(digest, sections, section_problems)
+
+
+def load_plan(path=MANIFEST, distr_dir=DISTR_DIR, sections=SECTIONS):
+    """
+    Возвращает план (разбор — из кэша) после проверки секций sections.
+    При ошибках в них выбрасывает ManifestError со всеми ошибками.
+    """
+    raw = Path(path).read_bytes()
+    key = (hashlib.sha256(raw).hexdigest(), str(distr_dir))
+    with _cache_lock:
+        plan = _cache.get(key)
+        if plan is None:
+            try:
+                data = json.loads(raw.decode("utf-8"))
+            except ValueError as e:
+                raise ManifestError([f"{path}: {e}"])
+            plan = compile_manifest(data, key[0], distr_dir)
+            _cache.clear()
+            _cache[key] = plan
+        problems = plan.check(sections)
+    if problems:
+        raise ManifestError(problems)
+    return plan
+
+
+if __name__ == "__main__":
+    try:
+        for line in load_plan().diff_lines():
+            print(line)
+    except ManifestError as e:
+        for problem in e.problems:
+            print(f"[ERR] {problem}")
+        sys.exit(1)
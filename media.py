@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск съемных носителей без запуска lsblk.
+
+Съемные устройства определяются по /sys/block/*/removable (то же, что
+колонка RM в lsblk), точки монтирования — по /proc/self/mountinfo.
+wait_for_media ждет изменения таблицы монтирования через poll() на
+/proc/self/mountinfo (ядро выставляет POLLPRI при каждом mount/umount)
+и возвращается, как только появляется подходящая флешка.
+
+Ожидание блокирующее: start.py ждет до запуска интерфейса, on_repo — в
+потоке TaskWorker. Отдельного фонового наблюдателя нет.
+"""
+import os
+import time
+import select
+from pathlib import Path
+
+SYS_BLOCK = Path("/sys/block")
+MOUNTINFO = "/proc/self/mountinfo"
+POLL_MS = 1000
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def removable_devnums():
+    """Номера major:minor съемных дисков и их разделов."""
+    devnums = set()
+    for disk in SYS_BLOCK.iterdir() if SYS_BLOCK.exists() else ():
+        if _read(disk / "removable") != "1":
+            continue
+        devnums.add(_read(disk / "dev"))
+        for part in disk.iterdir():
+            if (part / "partition").exists():
+                devnums.add(_read(part / "dev"))
+    devnums.discard("")
+    return devnums
+
+
+def _unescape(field):
+    # В mountinfo пробелы и спецсимволы записаны как \040 и т.п.
+    return field.encode().decode("unicode_escape").encode("latin-1").decode(
+        "utf-8", "replace")
+
+
+def removable_mounts():
+    """Точки монтирования съемных носителей в порядке mountinfo."""
+    devnums = removable_devnums()
+    mounts = []
+    if not devnums:
+        return mounts
+    try:
+        with open(MOUNTINFO, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 5 and parts[2] in devnums:
+                    mount = Path(_unescape(parts[4]))
+                    if mount not in mounts:
+                        mounts.append(mount)
+    except OSError:
+        pass
+    return mounts
+
+
+def has_repo(mount: Path):
+    """Флешка с репозитарием: возвращает корень, если есть dists и pool."""
+    if (mount / "dists").exists() and (mount / "pool").exists():
+        return mount
+    return None
+
+
+def has_tool(mount: Path):
+    """Флешка с AstraAdminTool: возвращает путь к папке AstraAdminTool."""
+    candidate = mount / "AstraAdminTool"
+    return candidate if candidate.is_dir() else None
+
+
+def find_media(match):
+    """Первый результат match(mount) среди съемных носителей или None."""
+    for mount in removable_mounts():
+        found = match(mount)
+        if found:
+            return found
+    return None
+
+
+def wait_for_media(match, timeout, should_stop=None, tick=None):
+    """
+    Ждет появления носителя до timeout секунд (None — без ограничения).
+    tick() вызывается примерно раз в секунду, пока идет ожидание.
+    Возвращает результат match или None.
+    """
+    found = find_media(match)
+    if found:
+        return found
+    deadline = None if timeout is None else time.monotonic() + timeout
+    fd = os.open(MOUNTINFO, os.O_RDONLY)
+    try:
+        poller = select.poll()
+        poller.register(fd, select.POLLPRI | select.POLLERR)
+        while True:
+            if should_stop and should_stop():
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            events = poller.poll(POLL_MS)
+            if tick:
+                tick()
+            if not events:
+                continue
+            # Перечитываем файл, чтобы сбросить событие
+            os.lseek(fd, 0, os.SEEK_SET)
+            while os.read(fd, 65536):
+                pass
+            found = find_media(match)
+            if found:
+                return found
+    finally:
+        os.close(fd)
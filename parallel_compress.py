@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Многопоточное сжатие потока для архивов отчета.
+
+ParallelGzipWriter сжимает поток блоками по GZIP_BLOCK в пуле потоков
+(zlib отпускает GIL), как это делает pigz: каждый блок — сырой deflate со
+словарем из последних 32 КБ предыдущего блока, завершенный Z_SYNC_FLUSH
+(последний — Z_FINISH). Склеенные по порядку блоки дают обычный
+одночленный gzip, который открывает любой gunzip/7-Zip.
+ZstdWriter отдает сжатие процессу zstd -T0 (или модулю zstandard с
+threads=-1); результат — обычный .zst.
+Оба пишут в любой файловый объект out и не закрывают его.
+"""
+import os
+import time
+import zlib
+import shutil
+import struct
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cmd_stream import tracked
+
+GZIP_BLOCK = 1024 * 1024
+DICT_SIZE = 32 * 1024
+PIPE_CHUNK = 1024 * 1024
+COMPRESS_THREADS = os.cpu_count() or 2
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _deflate(block, zdict, level, last):
+    if zdict:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter:
+    """Файловый объект только для записи: gzip со сжатием в threads потоков."""
+
+    def __init__(self, out, level=GZIP_LEVEL, threads=COMPRESS_THREADS):
+        self.out = out
+        self.level = level
+        self.threads = threads
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._buf = bytearray()
+        self._dict = b""
+        self._crc = 0
+        self._size = 0
+        self._closed = False
+        # Заголовок gzip: метод deflate, без флагов, mtime, ОС Unix
+        out.write(b"\x1f\x8b\x08\x00" + struct.pack("<I", int(time.time())) +
+                  b"\x00\x03")
+
+    def write(self, data):
+        self._buf += data
+        while len(self._buf) >= GZIP_BLOCK:
+            block = bytes(self._buf[:GZIP_BLOCK])
+            del self._buf[:GZIP_BLOCK]
+            self._submit(block, False)
+        return len(data)
+
+    def _submit(self, block, last):
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(
+            self._pool.submit(_deflate, block, self._dict, self.level, last))
+        self._dict = (self._dict + block)[-DICT_SIZE:]
+        # Ограничиваем число блоков в памяти
+        while len(self._pending) > self.threads * 2:
+            self.out.write(self._pending.popleft().result())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._submit(bytes(self._buf), True)
+            self._buf = bytearray()
+            while self._pending:
+                self.out.write(self._pending.popleft().result())
+            self.out.write(struct.pack("<II", self._crc & 0xFFFFFFFF,
+                                       self._size & 0xFFFFFFFF))
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+class ZstdWriter:
+    """Файловый объект только для записи: zstd -T0 или модуль zstandard."""
+
+    def __init__(self, out, level=ZSTD_LEVEL, threads=COMPRESS_THREADS):
+        self.out = out
+        self._proc = None
+        self._writer = None
+        self._error = None
+        if shutil.which("zstd"):
+            self._proc = subprocess.Popen(
+                ["zstd", f"-{level}", f"-T{threads}", "-q", "-c"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._tracked = tracked(self._proc)
+            self._tracked.__enter__()
+            self._pump = threading.Thread(target=self._copy_out, daemon=True)
+            self._pump.start()
+        else:
+            try:
+                import zstandard
+            except ImportError:
+                raise OSError("Для .tar.zst нужен zstd или модуль zstandard")
+            self._writer = zstandard.ZstdCompressor(
+                level=level, threads=-1).stream_writer(out, closefd=False)
+
+    def _copy_out(self):
+        try:
+            for chunk in iter(lambda: self._proc.stdout.read(PIPE_CHUNK), b""):
+                self.out.write(chunk)
+        except BaseException as e:
+            self._error = e
+
+    def write(self, data):
+        if self._writer is not None:
+            return self._writer.write(data)
+        self._proc.stdin.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            return
+        if self._proc.stdin.closed:
+            return
+        self._proc.stdin.close()
+        self._pump.join()
+        rc = self._proc.wait()
+        self._proc.stdout.close()
+        self._tracked.__exit__(None, None, None)
+        if self._error is not None:
+            raise self._error
+        if rc != 0:
+            raise OSError(f"zstd: код возврата {rc}")
+
+
+def open_compressor(out, kind, level=None, threads=COMPRESS_THREADS):
+    """Сжимающий поток поверх out: kind — "gz" или "zst"."""
+    if kind == "gz":
+        return ParallelGzipWriter(out, level or GZIP_LEVEL, threads)
+    if kind == "zst":
+        return ZstdWriter(out, level or ZSTD_LEVEL, threads)
+    raise ValueError(f"Неизвестное сжатие: {kind}")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Замеры времени и ресурсов по задачам настройки.
+
+Для каждой задачи записываются: время выполнения, процессорное время
+процесса и дочерних процессов (apt, dpkg, установщик), байты чтения и
+записи с диска и пиковый RSS процесса за время задачи. CPU и ввод-вывод
+берутся по всему процессу (getrusage, /proc/self/io), чтобы учитывать
+пулы копирования, проверки и распаковки в других потоках; поэтому у
+задач, работавших одновременно, эти значения пересекаются и включают
+работу соседей. RSS опрашивается фоновым потоком, пока задача идет.
+Задача считается неудачной, если она выбросила исключение или
+вызывающий отметил ее через fail() (например, по строке [ERR] в логе).
+Итог выводится таблицей и сохраняется в JSON, чтобы сравнивать прогоны
+на разном железе.
+"""
+import os
+import json
+import time
+import socket
+import platform
+import resource
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from copy_engine import fmt_size
+
+BLOCK_SIZE = 512  # ru_inblock/ru_oublock считаются в 512-байтных блоках
+PROCESS_IO = "/proc/self/io"
+PROCESS_STATM = "/proc/self/statm"
+RSS_INTERVAL = 0.2
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _process_io():
+    """(read_bytes, write_bytes) всего процесса или (0, 0)."""
+    values = {}
+    try:
+        with open(PROCESS_IO, "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                values[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return values.get("read_bytes", 0), values.get("write_bytes", 0)
+
+
+def _current_rss():
+    """Текущий RSS процесса в байтах или 0."""
+    try:
+        with open(PROCESS_STATM, "r") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _Snapshot:
+    def __init__(self):
+        self.wall = time.monotonic()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.cpu = usage.ru_utime + usage.ru_stime
+        self.children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.read, self.written = _process_io()
+
+
+class _Running:
+    """Идущая задача: пик RSS и отметка о неудаче."""
+
+    def __init__(self):
+        self.max_rss = _current_rss()
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+
+class TaskProfile:
+    """Замер одной задачи."""
+
+    def __init__(self, name, start: _Snapshot, end: _Snapshot, ok, max_rss):
+        child_start, child_end = start.children, end.children
+        self.name = name
+        self.ok = ok
+        self.wall = end.wall - start.wall
+        self.cpu = end.cpu - start.cpu
+        self.child_cpu = (child_end.ru_utime + child_end.ru_stime) - \
+            (child_start.ru_utime + child_start.ru_stime)
+        self.read_bytes = end.read - start.read + \
+            (child_end.ru_inblock - child_start.ru_inblock) * BLOCK_SIZE
+        self.write_bytes = end.written - start.written + \
+            (child_end.ru_oublock - child_start.ru_oublock) * BLOCK_SIZE
+        self.max_rss = max_rss
+
+    def as_dict(self):
+        return {
+            "name": self.name, "ok": self.ok,
+            "wall_s": round(self.wall, 3), "cpu_s": round(self.cpu, 3),
+            "child_cpu_s": round(self.child_cpu, 3),
+            "read_bytes": self.read_bytes, "write_bytes": self.write_bytes,
+            "max_rss_bytes": self.max_rss,
+        }
+
+
+class RunProfile:
+    """Замеры всех задач одного запуска (потокобезопасно)."""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.time()
+        self.tasks = []
+        self._lock = threading.Lock()
+        self._running = set()
+        self._sampler = None
+
+    def _sample(self):
+        """Фоновый опрос RSS, пока идет хотя бы одна задача."""
+        while True:
+            time.sleep(RSS_INTERVAL)
+            rss = _current_rss()
+            with self._lock:
+                if not self._running:
+                    self._sampler = None
+                    return
+                for task in self._running:
+                    task.max_rss = max(task.max_rss, rss)
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Замер блока with; значение — объект с методом fail(), которым
+        отмечается неудача задачи, не выбросившей исключение.
+        """
+        start = _Snapshot()
+        task = _Running()
+        with self._lock:
+            self._running.add(task)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        ok = False
+        try:
+            yield task
+            ok = not task.failed
+        finally:
+            end = _Snapshot()
+            with self._lock:
+                self._running.discard(task)
+                task.max_rss = max(task.max_rss, _current_rss())
+                self.tasks.append(TaskProfile(name, start, end, ok, task.max_rss))
+
+    def table(self):
+        """Строки итоговой таблицы для лога."""
+        width = max([len(t.name) for t in self.tasks] + [6])
+        lines = [f"[PROFILE] {'Задача':<{width}}  {'Время':>8}  {'CPU':>7}  "
+                 f"{'CPU дет.':>8}  {'Чтение':>10}  {'Запись':>10}  {'RSS пик':>10}"]
+        for t in self.tasks:
+            mark = "" if t.ok else "  (ошибка)"
+            lines.append(
+                f"[PROFILE] {t.name:<{width}}  {t.wall:>7.1f}с  {t.cpu:>6.1f}с  "
+                f"{t.child_cpu:>7.1f}с  {fmt_size(t.read_bytes):>10}  "
+                f"{fmt_size(t.write_bytes):>10}  {fmt_size(t.max_rss):>10}{mark}")
+        total = sum(t.wall for t in self.tasks)
+        lines.append(f"[PROFILE] Итого по задачам: {total:.1f} с, "
+                     f"общее время {time.time() - self.started:.1f} с")
+        lines.append("[PROFILE] CPU и ввод-вывод считаются по всему процессу: "
+                     "у параллельных задач они пересекаются")
+        return lines
+
+    def save(self, directory):
+        """Сохраняет профиль в directory/<label>_<время>.json, возвращает путь."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started))
+        path = directory / f"{self.label}_{stamp}.json"
+        data = {
+            "label": self.label,
+            "started": self.started,
+            "total_s": round(time.time() - self.started, 3),
+            "host": host_info(),
+            "tasks": [t.as_dict() for t in self.tasks],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        return path
+
+
+def host_info():
+    """Сведения о железе для сравнения прогонов."""
+    info = {"host": socket.gethostname(), "kernel": platform.release(),
+            "cpus": os.cpu_count()}
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    info["cpu_model"] = line.split(":", 1)[1].strip()
+                    break
+        with open("/proc/meminfo", "r") as f:
+            info["mem_total_kb"] = int(f.readline().split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return info
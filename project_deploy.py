@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Атомарное развертывание проекта Integrity с хранением прежних версий.
+
+Новая версия собирается в промежуточном каталоге рядом с рабочей:
+неизменившиеся файлы (тот же размер и mtime, для zip — тот же CRC)
+не копируются, а жестко связываются с файлами текущей версии. Готовый
+каталог меняется местами с рабочим одним renameat2(RENAME_EXCHANGE);
+если ядро или glibc его не поддерживают — двумя rename подряд.
+Последние KEEP_VERSIONS версий остаются в .deploy/<проект>/versions,
+и откат — такой же обмен каталогами.
+
+Жесткие ссылки общие у версий: если программа меняет файл проекта на
+месте (а не через запись нового файла), изменение видно и в прежних
+версиях.
+"""
+import os
+import time
+import zlib
+import shutil
+import ctypes
+import zipfile
+from pathlib import Path
+
+from copy_engine import copy_many, Progress
+from zip_extract import extract_members
+from archive_stream import TarStream, archive_kind
+
+KEEP_VERSIONS = 3
+STATE_NAME = ".deploy"
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+
+
+def _state_dir(root: Path, name):
+    """Каталог версий на той же ФС, что и root (иначе rename невозможен)."""
+    parent = root.parent
+    if parent.exists() and parent.stat().st_dev == root.stat().st_dev:
+        return parent / STATE_NAME / name
+    return root / STATE_NAME / name
+
+
+def _exchange(a: Path, b: Path):
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    rc = renameat2(AT_FDCWD, os.fsencode(str(a)), AT_FDCWD,
+                   os.fsencode(str(b)), RENAME_EXCHANGE)
+    return rc == 0
+
+
+def _version_stamp():
+    """Имя версии: время с наносекундами, уникально и сортируется по времени."""
+    return time.strftime("%Y%m%d_%H%M%S") + f"_{time.time_ns() % 10**9:09d}"
+
+
+def _prune(versions: Path, keep, log_func):
+    if not versions.exists():
+        return
+    for old in sorted(versions.iterdir())[:-keep or None]:
+        shutil.rmtree(old, ignore_errors=True)
+        log_func(f"[INFO] Удалена старая версия {old.name}")
+
+
+def _same_stat(live_file, size, mtime):
+    try:
+        st = os.stat(live_file)
+    except OSError:
+        return False
+    return st.st_size == size and int(st.st_mtime) == int(mtime)
+
+
+def _link(live_file, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.link(live_file, target)
+
+
+class StagedDeploy:
+    """Сборка новой версии проекта name в корне root."""
+
+    def __init__(self, root: Path, name, log_func, keep=KEEP_VERSIONS):
+        root.mkdir(parents=True, exist_ok=True)
+        self.root = root
+        self.name = name
+        self.log_func = log_func
+        self.keep = keep
+        self.live = root / name
+        state = _state_dir(root, name)
+        self.versions = state / "versions"
+        self.stamp = _version_stamp()
+        self.stage = state / f"staging.{self.stamp}"
+        shutil.rmtree(self.stage, ignore_errors=True)
+        self.stage.mkdir(parents=True)
+        self.linked = 0
+        self.written = 0
+        # True, как только новая версия стала рабочей: stage после обмена
+        # содержит прежнюю версию, удалять его уже нельзя
+        self.activated = False
+
+    def link_or_none(self, rel, size, mtime):
+        """Связывает неизменившийся файл с текущей версией. True — связан."""
+        live_file = os.path.join(self.live, rel)
+        if _same_stat(live_file, size, mtime):
+            _link(live_file, os.path.join(self.stage, rel))
+            self.linked += 1
+            return True
+        return False
+
+    def _activate(self):
+        """Делает stage рабочим каталогом, прежний уносит в versions."""
+        old = self.versions / self.stamp
+        old.parent.mkdir(parents=True, exist_ok=True)
+        if not self.live.exists():
+            os.rename(self.stage, self.live)
+            self.activated = True
+        elif _exchange(self.stage, self.live):
+            self.activated = True
+            os.rename(self.stage, old)
+        else:
+            os.rename(self.live, old)
+            try:
+                os.rename(self.stage, self.live)
+            except OSError:
+                os.rename(old, self.live)
+                raise
+            self.activated = True
+
+    def commit(self):
+        self._activate()
+        _prune(self.versions, self.keep, self.log_func)
+        self.log_func(f"[OK] Проект развернут -> {self.live} "
+                      f"(новых файлов {self.written}, без изменений {self.linked})")
+
+    def abort(self):
+        if not self.activated:
+            shutil.rmtree(self.stage, ignore_errors=True)
+        elif self.stage.exists():
+            self.log_func(f"[WARN] Прежняя версия {self.name} осталась в "
+                          f"{self.stage}")
+
+
+def deploy_tree(src, root: Path, name, log_func, keep=KEEP_VERSIONS):
+    """Разворачивает каталог src как проект name."""
+    deploy = StagedDeploy(root, name, log_func, keep)
+    try:
+        pairs = []
+        total = 0
+        for dirpath, _dirs, files in os.walk(src):
+            rel_dir = os.path.relpath(dirpath, src)
+            os.makedirs(os.path.join(deploy.stage, rel_dir), exist_ok=True)
+            for fname in files:
+                path = os.path.join(dirpath, fname)
+                rel = os.path.normpath(os.path.join(rel_dir, fname))
+                st = os.stat(path)
+                if not deploy.link_or_none(rel, st.st_size, st.st_mtime):
+                    pairs.append((path, os.path.join(deploy.stage, rel)))
+                    total += st.st_size
+        copy_many(pairs, progress=Progress(log_func, total, f"Копирование {name}"))
+        deploy.written = len(pairs)
+        deploy.commit()
+    except BaseException:
+        deploy.abort()
+        raise
+
+
+def _file_crc(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _stage_zip(deploy, path, progress):
+    """Неизменившиеся элементы связывает, остальные распаковывает пулом потоков."""
+    with zipfile.ZipFile(path, "r") as z:
+        infos = z.infolist()
+    changed = []
+    for info in infos:
+        live_file = os.path.join(deploy.live, info.filename)
+        if not info.is_dir() and os.path.isfile(live_file) \
+                and os.path.getsize(live_file) == info.file_size \
+                and _file_crc(live_file) == info.CRC:
+            _link(live_file, os.path.join(deploy.stage, info.filename))
+            deploy.linked += 1
+            continue
+        changed.append(info.filename)
+        progress.total += info.file_size
+    extract_members(path, changed, deploy.stage, progress=progress)
+    deploy.written = progress.files
+
+
+def _stage_tar(deploy, path, progress):
+    """Потоковый разбор tar: прогресс считается по сжатым байтам."""
+    with TarStream(path) as stream:
+        progress.total = stream.size
+        for member in stream.members(progress):
+            if member.isfile() and deploy.link_or_none(
+                    os.path.normpath(member.name), member.size, member.mtime):
+                continue
+            stream.tar.extract(member, deploy.stage)
+            if member.isfile():
+                progress.file_done()
+    deploy.written = progress.files
+
+
+def deploy_archive(path, root: Path, name, log_func, keep=KEEP_VERSIONS):
+    """Разворачивает архив zip или tar (gz, xz, zst) как проект name."""
+    kind = archive_kind(path)
+    if kind is None:
+        raise ValueError(f"Неизвестный формат архива: {path}")
+    deploy = StagedDeploy(root, name, log_func, keep)
+    progress = Progress(log_func, 0, f"Распаковка {name}")
+    try:
+        if kind == "zip":
+            _stage_zip(deploy, path, progress)
+        else:
+            _stage_tar(deploy, path, progress)
+        progress.finish()
+        deploy.commit()
+    except BaseException:
+        deploy.abort()
+        raise
+
+
+def saved_projects(root: Path):
+    """Проекты в root, у которых есть сохраненные версии для отката."""
+    projects = []
+    for live in sorted(root.iterdir()) if root.exists() else ():
+        versions = _state_dir(root, live.name) / "versions"
+        if live.is_dir() and versions.is_dir() and any(versions.iterdir()):
+            projects.append(live.name)
+    return projects
+
+
+def rollback(root: Path, name, log_func):
+    """Меняет местами рабочую версию проекта и последнюю сохраненную."""
+    live = root / name
+    versions = _state_dir(root, name) / "versions"
+    saved = sorted(versions.iterdir()) if versions.exists() else []
+    if not saved:
+        log_func(f"[WARN] Нет сохраненных версий {name}")
+        return False
+    previous = saved[-1]
+    if not _exchange(previous, live):
+        tmp = previous.with_name(previous.name + ".swap")
+        os.rename(live, tmp)
+        os.rename(previous, live)
+        os.rename(tmp, previous)
+    # Бывшая рабочая версия становится самой новой сохраненной
+    os.rename(previous, versions / _version_stamp())
+    log_func(f"[OK] {name} откачен на версию {previous.name}")
+    return True
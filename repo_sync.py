@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Инкрементальная синхронизация локального репозитария /opt/repo с флешкой.
+
+Вместо удаления /opt/repo и полного копирования dists и pool хранится индекс
+(размер, mtime, sha256) каждого файла репозитария. При повторном запуске
+копируются только новые и изменившиеся файлы, устаревшие удаляются.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+
+from copy_engine import copy_many, fmt_size, Progress
+
+REPO_DIR = Path("/opt/repo")
+REPO_FOLDERS = ("dists", "pool")
+INDEX_NAME = ".astra_sync_index.json"
+INDEX_VERSION = 1
+HASH_BUFSIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_BUFSIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_index(repo: Path):
+    """Читает индекс синхронизации. При любой ошибке возвращает пустой индекс."""
+    try:
+        with open(repo / INDEX_NAME, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == INDEX_VERSION:
+            return data.get("files", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save_index(repo: Path, files):
+    path = repo / INDEX_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "files": files}, f)
+    os.replace(tmp, path)
+
+
+def _same_stat(st, entry):
+    return entry is not None and st.st_size == entry["size"] \
+        and st.st_mtime_ns == entry["mtime_ns"]
+
+
+def _entry(st, digest):
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+
+
+def sync_repo(usb_path: Path, log_func, dst_repo: Path = REPO_DIR,
+              folders=REPO_FOLDERS, workers=None):
+    """
+    Синхронизирует папки folders с флешки usb_path в dst_repo.
+    Файл пропускается, если его размер и mtime совпадают с индексом и с копией
+    в dst_repo. При совпадении размера, но другом mtime сравнивается sha256.
+    Новые и изменившиеся файлы копируются параллельно через copy_engine.
+    Возвращает словарь со статистикой.
+    """
+    started = time.monotonic()
+    dst_repo.mkdir(parents=True, exist_ok=True)
+    old_index = load_index(dst_repo)
+    index = {}
+    stats = {"copied": 0, "bytes": 0, "same": 0, "removed": 0}
+    to_copy = []
+    synced = []
+
+    for folder_name in folders:
+        src_folder = usb_path / folder_name
+        dst_folder = dst_repo / folder_name
+        if not src_folder.exists():
+            log_func(f"[WARN] Папка {folder_name} не найдена на флешке")
+            # Не трогаем то, что уже лежит в /opt/repo
+            for rel, entry in old_index.items():
+                if rel.split("/", 1)[0] == folder_name:
+                    index[rel] = entry
+            continue
+
+        synced.append(dst_folder)
+        for root, _dirs, files in os.walk(src_folder):
+            rel_root = os.path.relpath(root, usb_path).replace(os.sep, "/")
+            dst_root = os.path.join(str(dst_repo), rel_root)
+            os.makedirs(dst_root, exist_ok=True)
+            for name in files:
+                rel = f"{rel_root}/{name}"
+                src = os.path.join(root, name)
+                dst = os.path.join(dst_root, name)
+                st = os.stat(src)
+                entry = old_index.get(rel)
+                try:
+                    dst_st = os.stat(dst)
+                except FileNotFoundError:
+                    dst_st = None
+
+                if dst_st is not None and dst_st.st_size == st.st_size:
+                    if dst_st.st_mtime_ns == st.st_mtime_ns:
+                        # Быстрая проверка: размер и mtime совпадают
+                        if _same_stat(st, entry):
+                            index[rel] = entry
+                        else:
+                            index[rel] = _entry(st, file_sha256(dst))
+                        stats["same"] += 1
+                        continue
+                    if entry is not None and entry["size"] == st.st_size \
+                            and file_sha256(src) == entry["sha256"]:
+                        # Содержимое то же, поменялось только время
+                        shutil.copystat(src, dst)
+                        index[rel] = _entry(st, entry["sha256"])
+                        stats["same"] += 1
+                        continue
+
+                to_copy.append((rel, st, src, dst))
+                index[rel] = None
+                stats["copied"] += 1
+                stats["bytes"] += st.st_size
+
+    progress = Progress(log_func, stats["bytes"], f"Копирование в {dst_repo}")
+    digests = copy_many([(src, dst) for _rel, _st, src, dst in to_copy],
+                        workers, progress, hashed=True, atomic=True)
+    for (rel, st, _src, _dst), digest in zip(to_copy, digests):
+        index[rel] = _entry(st, digest)
+    if to_copy:
+        progress.finish()
+
+    # Удаляем файлы, которых больше нет на флешке
+    for dst_folder in synced:
+        for root, _dirs, files in os.walk(dst_folder, topdown=False):
+            rel_root = os.path.relpath(root, dst_repo).replace(os.sep, "/")
+            for name in files:
+                if f"{rel_root}/{name}" not in index:
+                    os.unlink(os.path.join(root, name))
+                    stats["removed"] += 1
+            if not os.listdir(root):
+                os.rmdir(root)
+
+    save_index(dst_repo, index)
+    log_func(
+        f"[OK] Синхронизация {dst_repo}: скопировано {stats['copied']} "
+        f"({fmt_size(stats['bytes'])}), без изменений {stats['same']}, "
+        f"удалено {stats['removed']} за {time.monotonic() - started:.1f} с")
+    return stats
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка целостности локального репозитария по Release и Packages.
+
+Для каждого dists/<suite>/Release проверяются sha256 индексов, затем из
+индексов Packages берутся Filename/Size/SHA256 всех пакетов pool и
+проверяются пулом потоков. Если файл только что скопирован repo_sync и
+его размер и mtime совпадают с индексом синхронизации, используется уже
+посчитанный при копировании sha256 вместо повторного чтения.
+"""
+import os
+import gzip
+import lzma
+import json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from repo_sync import REPO_DIR, load_index, file_sha256
+
+VERIFY_WORKERS = os.cpu_count() or 2
+REPORT_NAME = ".astra_verify_report.json"
+REPORT_LINES = 20
+PACKAGES_NAMES = ("Packages", "Packages.gz", "Packages.xz")
+
+
+def parse_release(path: Path):
+    """Возвращает {относительный путь: (size, sha256)} из раздела SHA256."""
+    files = {}
+    in_sha = False
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.startswith(" "):
+                in_sha = line.rstrip() == "SHA256:"
+                continue
+            if in_sha:
+                parts = line.split()
+                if len(parts) == 3:
+                    files[parts[2]] = (int(parts[1]), parts[0])
+    return files
+
+
+def _open_index(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.suffix == ".xz":
+        return lzma.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def parse_packages(path: Path):
+    """Генерирует (Filename, size, sha256) для каждой записи Packages."""
+    fields = {}
+    with _open_index(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                if "Filename" in fields:
+                    yield fields["Filename"], int(fields.get("Size", -1)), \
+                        fields.get("SHA256")
+                fields = {}
+                continue
+            if line[0] in " \t":
+                continue
+            key, _, value = line.partition(":")
+            if key in ("Filename", "Size", "SHA256"):
+                fields[key] = value.strip()
+    if "Filename" in fields:
+        yield fields["Filename"], int(fields.get("Size", -1)), fields.get("SHA256")
+
+
+def _collect(repo: Path, report):
+    """Собирает список проверок (rel, size, sha256) по Release и Packages."""
+    checks = {}
+    for release in sorted((repo / "dists").glob("*/Release")):
+        suite = release.parent
+        entries = parse_release(release)
+        indexes = {}
+        for name, (size, digest) in entries.items():
+            if (suite / name).exists():
+                rel = os.path.relpath(suite / name, repo).replace(os.sep, "/")
+                checks[rel] = (size, digest)
+                if Path(name).name in PACKAGES_NAMES:
+                    indexes.setdefault(str(Path(name).parent), []).append(name)
+        # Для каждого каталога берем один вариант Packages (предпочтительно несжатый)
+        for names in indexes.values():
+            name = min(names, key=lambda n: PACKAGES_NAMES.index(Path(n).name))
+            try:
+                for filename, size, digest in parse_packages(suite / name):
+                    if digest:
+                        checks[filename] = (size, digest)
+            except (OSError, EOFError, ValueError) as e:
+                report["errors"].append(f"{suite / name}: {e}")
+    return checks
+
+
+def _check(repo, rel, size, digest, index):
+    path = repo / rel
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return "missing"
+    if size >= 0 and st.st_size != size:
+        return "mismatch"
+    entry = index.get(rel)
+    if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        actual = entry["sha256"]
+    else:
+        actual = file_sha256(path)
+    return "ok" if actual == digest else "mismatch"
+
+
+def verify_repo(repo: Path = REPO_DIR, log_func=print, workers=None,
+                use_index=True):
+    """
+    Проверяет репозитарий, пишет итог в log_func и отчет в REPORT_NAME.
+    Возвращает отчет: {"checked", "missing": [...], "mismatch": [...], "errors": [...]}.
+    """
+    report = {"checked": 0, "missing": [], "mismatch": [], "errors": []}
+    if not list((repo / "dists").glob("*/Release")):
+        log_func(f"[WARN] В {repo}/dists нет файлов Release, проверка пропущена")
+        return report
+    checks = _collect(repo, report)
+    index = load_index(repo) if use_index else {}
+    items = sorted(checks.items())
+    with ThreadPoolExecutor(max_workers=workers or VERIFY_WORKERS) as pool:
+        results = pool.map(
+            lambda kv: _check(repo, kv[0], kv[1][0], kv[1][1], index), items)
+        for (rel, _), status in zip(items, results):
+            report["checked"] += 1
+            if status != "ok":
+                report[status].append(rel)
+
+    try:
+        with open(repo / REPORT_NAME, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    except OSError as e:
+        log_func(f"[WARN] Не удалось сохранить отчет проверки: {e}")
+
+    for kind, label in (("missing", "отсутствует"), ("mismatch", "контрольная сумма")):
+        for rel in report[kind][:REPORT_LINES]:
+            log_func(f"[ERR] {rel}: {label}")
+    for err in report["errors"]:
+        log_func(f"[ERR] {err}")
+    bad = len(report["missing"]) + len(report["mismatch"])
+    if bad or report["errors"]:
+        log_func(f"[WARN] Проверка {repo}: {report['checked']} файлов, "
+                 f"отсутствует {len(report['missing'])}, "
+                 f"повреждено {len(report['mismatch'])}")
+    else:
+        log_func(f"[OK] Проверка {repo}: {report['checked']} файлов без ошибок")
+    return report
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковая запись архива отчета за один проход.
+
+Файлы и каталоги читаются с диска прямо в архив, без промежуточной копии
+и без вложенных архивов. Уже сжатые файлы (ротированные .gz логи, .xz,
+.zst, .zip, картинки) кладутся без повторного сжатия (ZIP_STORED),
+остальные сжимаются deflate. Выходной поток может быть неперематываемым
+(труба, разбиение на тома): zipfile тогда пишет размеры в дескрипторах
+данных после каждого файла.
+
+Форматы tar.gz и tar.zst сжимают весь поток многопоточно
+(parallel_compress) — быстрее на многоядерных машинах, но уже сжатые
+файлы в них сжимаются повторно. Формат выбирается в open_archive.
+"""
+import io
+import os
+import stat
+import time
+import hashlib
+import tarfile
+import zipfile
+
+from parallel_compress import open_compressor, COMPRESS_THREADS
+
+DEFLATE_LEVEL = 6
+BUFSIZE = 1024 * 1024
+# Формат -> (суффикс имени архива, сжатие потока для tar)
+FORMATS = {
+    "zip": (".zip", None),
+    "tar.gz": (".tar.gz", "gz"),
+    "tar.zst": (".tar.zst", "zst"),
+}
+
+# Расширения файлов, которые уже сжаты: повторное сжатие только тратит CPU
+COMPRESSED_SUFFIXES = frozenset((
+    ".gz", ".tgz", ".xz", ".txz", ".zst", ".tzst", ".bz2", ".lz4", ".lzma",
+    ".zip", ".7z", ".rar", ".deb", ".jar",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp3", ".mp4", ".avi",
+))
+
+
+def is_compressed(name):
+    return os.path.splitext(name)[1].lower() in COMPRESSED_SUFFIXES
+
+
+def _file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BUFSIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class _Hashing:
+    """Читатель, считающий sha256 прочитанного."""
+
+    def __init__(self, f):
+        self.f = f
+        self.hasher = hashlib.sha256()
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.hasher.update(data)
+        return data
+
+
+class _Archive:
+    """
+    Общая часть архивов отчета: обход каталогов и счетчики.
+    add_* потоконебезопасны: запись должна идти из одного потока
+    (в sysreport это обеспечивает блокировка «archive» планировщика).
+    delta (report_delta.DeltaState) решает, какие файлы писать, и
+    получает их sha256; без delta хеши не считаются. Наследники
+    определяют add_bytes(arcname, data, mtime), add_file(path, arcname,
+    st, digest) — пишет файл и, если digest, возвращает его sha256 — и
+    close().
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.delta = None
+
+    def _add_source(self, path, arcname, st):
+        if self.delta is not None and not self.delta.select(path, st):
+            return
+        digest = self.add_file(path, arcname, st, self.delta is not None)
+        if self.delta is not None:
+            self.delta.record(path, st, digest)
+
+    def add_path(self, path, arcname, deadline=None):
+        """Файл или каталог path под именем arcname. Возвращает список ошибок."""
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            return self.add_tree(path, arcname, deadline)
+        self._add_source(path, arcname, os.stat(path))
+        return []
+
+    def add_tree(self, root, arcname, deadline=None):
+        """
+        Добавляет каталог root под именем arcname. Обычные файлы и ссылки
+        на них пишутся, остальное пропускается. Возвращает список ошибок
+        (файлы, которые не удалось прочитать). Если к моменту следующего
+        файла прошел deadline (time.monotonic), выбрасывает TimeoutError:
+        уже записанные файлы остаются в архиве целыми.
+        """
+        errors = []
+        stack = [(root, arcname)]
+        while stack:
+            path, name = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                errors.append(f"{path}: {e.strerror}")
+                continue
+            for entry in entries:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"{root}: не уложились в срок")
+                member = f"{name}/{entry.name}"
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, member))
+                        continue
+                    st = entry.stat()
+                    if stat.S_ISREG(st.st_mode):
+                        self._add_source(entry.path, member, st)
+                except OSError as e:
+                    errors.append(f"{entry.path}: {e.strerror}")
+        return errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ReportArchive(_Archive):
+    """Zip-архив отчета поверх файлового объекта out."""
+
+    def __init__(self, out, level=DEFLATE_LEVEL):
+        super().__init__()
+        self.level = level
+        self._zip = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED,
+                                    allowZip64=True, compresslevel=level)
+
+    def add_bytes(self, arcname, data, mtime=None):
+        info = zipfile.ZipInfo(arcname, time.localtime(mtime)[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = (stat.S_IFREG | 0o644) << 16
+        self._zip.writestr(info, data, compresslevel=self.level)
+        self.files += 1
+        self.bytes += len(data)
+
+    def add_file(self, path, arcname, st=None, digest=False):
+        # ZipFile.write читает файл сам, поэтому sha256 для delta
+        # считается отдельным чтением (только для записываемых файлов)
+        sha256 = _file_sha256(path) if digest else None
+        compress_type = zipfile.ZIP_STORED if is_compressed(path) \
+            else zipfile.ZIP_DEFLATED
+        self._zip.write(path, arcname, compress_type, self.level)
+        self.files += 1
+        self.bytes += self._zip.infolist()[-1].file_size
+        return sha256
+
+    def close(self):
+        self._zip.close()
+
+
+class _Exact:
+    """
+    Читает ровно size байт: если файл укоротился во время чтения,
+    дополняет нулями, иначе tar-поток оказался бы испорчен.
+    """
+
+    def __init__(self, f, size, digest=False):
+        self.f = _Hashing(f) if digest else f
+        self.left = size
+
+    def read(self, n=-1):
+        n = self.left if n < 0 else min(n, self.left)
+        data = self.f.read(n)
+        if len(data) < n:
+            data += b"\0" * (n - len(data))
+        self.left -= n
+        return data
+
+
+class TarReportArchive(_Archive):
+    """Tar-архив отчета, сжимаемый многопоточно (kind — "gz" или "zst")."""
+
+    def __init__(self, out, kind, level=None, threads=COMPRESS_THREADS):
+        super().__init__()
+        self._stream = open_compressor(out, kind, level, threads)
+        self._tar = tarfile.open(fileobj=self._stream, mode="w|",
+                                 format=tarfile.PAX_FORMAT)
+
+    def add_bytes(self, arcname, data, mtime=None):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = time.time() if mtime is None else mtime
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+        self.files += 1
+        self.bytes += len(data)
+
+    def add_file(self, path, arcname, st=None, digest=False):
+        with open(path, "rb") as f:
+            info = self._tar.gettarinfo(arcname=arcname, fileobj=f)
+            reader = _Exact(f, info.size, digest)
+            self._tar.addfile(info, reader)
+        self.files += 1
+        self.bytes += info.size
+        return reader.f.hasher.hexdigest() if digest else None
+
+    def close(self):
+        try:
+            self._tar.close()
+        finally:
+            self._stream.close()
+
+
+def open_archive(out, fmt="zip", level=None, threads=COMPRESS_THREADS):
+    """Архив отчета формата fmt (ключ FORMATS) поверх out."""
+    _suffix, kind = FORMATS[fmt]
+    if kind is None:
+        return ReportArchive(out, level or DEFLATE_LEVEL)
+    return TarReportArchive(out, kind, level, threads)
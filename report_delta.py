@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Манифест собранных файлов для инкрементального (delta) отчета.
+
+После сбора с --delta или --baseline сохраняется {путь: размер, mtime,
+sha256} всех файлов, попавших в архив; обычный полный сбор манифест не
+ведет и хеши не считает. В delta-режиме файл пишется в архив, только
+если он новый или его размер/mtime изменились; sha256 считается только
+для записываемых файлов. В архив кладется индекс
+<host>_delta.json: какой сбор взят за основу, какие файлы добавлены,
+изменены и удалены. Распаковка delta поверх предыдущего архива дает
+текущее состояние.
+"""
+import os
+import json
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+MANIFEST_PATH = BASE_DIR / "Logs" / "report_manifest.json"
+
+
+class DeltaState:
+    """Сравнение файлов с прошлым сбором; full=True — берутся все файлы."""
+
+    def __init__(self, previous=None, full=True):
+        previous = previous or {}
+        self.full = full
+        self.base = previous.get("archive")
+        self.base_created = previous.get("created")
+        self.previous = previous.get("files", {})
+        self.files = {}
+        self.added = []
+        self.changed = []
+        self.unchanged = 0
+
+    @classmethod
+    def load(cls, path=MANIFEST_PATH, full=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f), full)
+        except (OSError, ValueError):
+            return cls(None, full)
+
+    def select(self, path, st):
+        """Нужно ли писать файл в архив."""
+        old = self.previous.get(path)
+        if self.full or old is None or old["size"] != st.st_size \
+                or old["mtime_ns"] != st.st_mtime_ns:
+            return True
+        # Не изменился: переносим запись из прошлого манифеста
+        self.files[path] = old
+        self.unchanged += 1
+        return False
+
+    def record(self, path, st, digest):
+        """Файл записан в архив с хешем digest."""
+        old = self.previous.get(path)
+        if old is None:
+            self.added.append(path)
+        elif old.get("sha256") != digest:
+            self.changed.append(path)
+        else:
+            self.unchanged += 1
+        self.files[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                            "sha256": digest}
+
+    def carry_forward(self, root):
+        """
+        Сбор root не завершился (тайм-аут, ошибка чтения): файлы под root,
+        до которых не дошли, остаются в манифесте с прежними записями и
+        не считаются удаленными.
+        """
+        root = root.rstrip("/")
+        for path, old in self.previous.items():
+            if path not in self.files and (
+                    path == root or path.startswith(root + "/")):
+                self.files[path] = old
+
+    def deleted(self):
+        return sorted(p for p in self.previous if p not in self.files)
+
+    def index(self, archive_name):
+        """Индекс для архива: основа, добавленные, измененные, удаленные."""
+        return {
+            "mode": "full" if self.full else "delta",
+            "archive": archive_name,
+            "base": None if self.full else self.base,
+            "base_created": None if self.full else self.base_created,
+            "added": self.added,
+            "changed": self.changed,
+            "deleted": self.deleted(),
+            "unchanged": self.unchanged,
+        }
+
+    def save(self, archive_name, path=MANIFEST_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"archive": archive_name, "created": time.time(),
+                       "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp, path)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Разбиение потока архива на тома фиксированного размера.
+
+FAT32 не хранит файлы больше 4 ГиБ, поэтому архив отчета пишется сразу
+на флешку томами <имя>.001, <имя>.002, ... не больше VOLUME_SIZE.
+sha256 каждого тома считается при записи и сохраняется в <имя>.sha256 в
+формате sha256sum. Если архив уместился в один том, он получает обычное
+имя без номера.
+
+Сборка и проверка на компьютере оператора:
+    python3 report_volumes.py verify <имя>.sha256
+    python3 report_volumes.py join <имя>.sha256 <файл или ->
+join проверяет тома по ходу чтения и пишет архив один раз (или в stdout,
+например в unzip/tar). То же делают sha256sum -c и cat <имя>.[0-9]* > <имя>.
+"""
+import os
+import sys
+import hashlib
+import argparse
+from pathlib import Path
+
+FAT32_LIMIT = 4 * 1024 * 1024 * 1024 - 1
+VOLUME_SIZE = FAT32_LIMIT // (1024 * 1024) * 1024 * 1024
+BUFSIZE = 4 * 1024 * 1024
+
+
+def volume_path(base: Path, number):
+    return base.with_name(f"{base.name}.{number:03d}")
+
+
+def sums_path(base: Path):
+    return base.with_name(base.name + ".sha256")
+
+
+class VolumeWriter:
+    """
+    Файловый объект только для записи: байты режутся на тома base.NNN.
+    Перемотки нет — zipfile и tarfile пишут в него как в трубу.
+    """
+
+    def __init__(self, base: Path, volume_size=VOLUME_SIZE):
+        self.base = Path(base)
+        self.volume_size = volume_size
+        self.volumes = []
+        self.sums = sums_path(self.base)
+        self._file = None
+        self._hasher = None
+        self._written = 0
+        self._position = 0
+
+    def _open_next(self):
+        path = volume_path(self.base, len(self.volumes) + 1)
+        self._file = open(path, "wb")
+        self._hasher = hashlib.sha256()
+        self._written = 0
+        self.volumes.append([path, None])
+
+    def _close_current(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        # Данные должны оказаться на флешке до ее извлечения
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self.volumes[-1][1] = self._hasher.hexdigest()
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            if self._file is None or self._written >= self.volume_size:
+                self._close_current()
+                self._open_next()
+            part = view[:self.volume_size - self._written]
+            self._file.write(part)
+            self._hasher.update(part)
+            self._written += len(part)
+            self._position += len(part)
+            view = view[len(part):]
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Закрывает последний том и пишет .sha256. Возвращает путь к нему."""
+        if self._file is None and not self.volumes:
+            self._open_next()
+        self._close_current()
+        if len(self.volumes) == 1:
+            os.replace(self.volumes[0][0], self.base)
+            self.volumes[0][0] = self.base
+        with open(self.sums, "w", encoding="utf-8") as f:
+            for volume, digest in self.volumes:
+                f.write(f"{digest}  {volume.name}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return self.sums
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            self._file.close()
+        return False
+
+
+def read_sums(path: Path):
+    """[(имя тома, sha256)] из файла формата sha256sum."""
+    volumes = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                digest, name = line.rstrip("\n").split(None, 1)
+                volumes.append((name.lstrip("*"), digest))
+    return volumes
+
+
+def join(path: Path, out, check_only=False):
+    """
+    Читает тома по порядку, проверяя sha256, и пишет их в out.
+    Возвращает список проблем (пустой — все тома целы).
+    """
+    path = Path(path)
+    problems = []
+    for name, digest in read_sums(path):
+        volume = path.with_name(name)
+        hasher = hashlib.sha256()
+        try:
+            with open(volume, "rb") as f:
+                for chunk in iter(lambda: f.read(BUFSIZE), b""):
+                    hasher.update(chunk)
+                    if not check_only:
+                        out.write(chunk)
+        except OSError as e:
+            problems.append(f"{name}: {e.strerror}")
+            continue
+        if hasher.hexdigest() != digest:
+            problems.append(f"{name}: контрольная сумма не совпадает")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Проверка и сборка томов архива отчета")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_verify = sub.add_parser("verify", help="проверить тома по .sha256")
+    p_verify.add_argument("sums", type=Path)
+    p_join = sub.add_parser("join", help="собрать архив из томов")
+    p_join.add_argument("sums", type=Path)
+    p_join.add_argument("out", help="файл архива или - для stdout")
+    args = parser.parse_args(argv)
+
+    if args.command == "verify":
+        problems = join(args.sums, None, check_only=True)
+    elif args.out == "-":
+        problems = join(args.sums, sys.stdout.buffer)
+    else:
+        with open(args.out, "wb") as out:
+            problems = join(args.sums, out)
+    for problem in problems:
+        print(f"[ERR] {problem}", file=sys.stderr)
+    if not problems:
+        print("[OK] Все тома целы", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
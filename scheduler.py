@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Планировщик задач настройки с учетом зависимостей.
+
+Задачи образуют DAG: задача запускается, когда завершены все её зависимости
+из числа выбранных. Независимые задачи выполняются одновременно в пуле
+потоков ограниченного размера. Задачи с общим ресурсом (locks), например
+apt/dpkg или интерактивное окно, друг с другом не пересекаются.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PROVISION_WORKERS = 4
+
+
+class Task:
+    """Задача настройки: func(log_func), зависимости deps и ресурсы locks."""
+
+    def __init__(self, key, func, deps=(), locks=(), name=None):
+        self.key = key
+        self.func = func
+        self.deps = tuple(deps)
+        self.locks = frozenset(locks)
+        self.name = name or key
+
+
+def run_dag(tasks, log_func, workers=PROVISION_WORKERS,
+            on_start=None, on_finish=None, on_skip=None, report=None):
+    """
+    Выполняет задачи с учетом зависимостей. Зависимости от невыбранных
+    задач игнорируются. Если задача упала с исключением, зависящие от неё
+    пропускаются. Исключение, не являющееся Exception (например отмена),
+    останавливает запуск новых задач и пробрасывается после завершения
+    уже запущенных.
+    on_start(task), on_finish(task, elapsed, error) и on_skip(task) (для
+    пропущенных) вызываются из потока планировщика, собственные
+    сообщения пишутся в report (по умолчанию log_func).
+    """
+    report = report or log_func
+    tasks = list(tasks)
+    by_key = {t.key: t for t in tasks}
+    deps = {t.key: {d for d in t.deps if d in by_key} for t in tasks}
+    finished, failed, started = set(), set(), set()
+    held = set()
+    running = {}
+    stop = None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            skipped = True
+            while stop is None and skipped:
+                skipped = False
+                for task in tasks:
+                    if task.key in started or len(running) >= workers:
+                        continue
+                    if deps[task.key] & failed:
+                        started.add(task.key)
+                        failed.add(task.key)
+                        skipped = True
+                        report(f"[WARN] {task.name}: пропущено, "
+                               f"не выполнены зависимости")
+                        if on_skip:
+                            on_skip(task)
+                        continue
+                    if not deps[task.key] <= finished or held & task.locks:
+                        continue
+                    started.add(task.key)
+                    held |= task.locks
+                    if on_start:
+                        on_start(task)
+                    fut = pool.submit(task.func, log_func)
+                    running[fut] = (task, time.monotonic())
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                task, t0 = running.pop(fut)
+                held -= task.locks
+                error = fut.exception()
+                if error is None:
+                    finished.add(task.key)
+                elif isinstance(error, Exception):
+                    failed.add(task.key)
+                    report(f"[ERR] {task.name}: {error}")
+                elif stop is None:
+                    failed.add(task.key)
+                    stop = error
+                if on_finish:
+                    on_finish(task, time.monotonic() - t0, error)
+
+    if stop is not None:
+        raise stop
+    unreached = [t.name for t in tasks if t.key not in started]
+    if unreached:
+        report(f"[ERR] Циклические зависимости: {', '.join(unreached)}")
+    return finished, failed
@@ -5,6 +5,8 @@ import sys
 import shutil
 import subprocess
 from pathlib import Path
+from copy_engine import copytree
+from media import find_media, has_tool, wait_for_media
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QMessageBox
 from PyQt5.QtCore import Qt
 
@@ -12,32 +14,21 @@ from PyQt5.QtCore import Qt
 WIN_WIDTH, WIN_HEIGHT = 700, 450
 TARGET_DIR = Path("/var/AstraAdminTool")
 BASE_DIR = Path(__file__).resolve().parent
+MEDIA_WAIT = 60  # сколько ждать флешку с AstraAdminTool, с
 
 
 # ---------------- Вспомогательные функции ----------------
 def find_flash_lsblk():
     """
-    Ищет флешку с AstraAdminTool через lsblk.
+    Ищет флешку с AstraAdminTool (по /sys/block и /proc/self/mountinfo).
+    Если флешка еще не смонтирована, ждет её до MEDIA_WAIT секунд.
     Возвращает путь к папке AstraAdminTool на флешке или None.
     """
-    try:
-        result = subprocess.run(
-            ["lsblk", "-o", "NAME,RM,MOUNTPOINT", "-nr"],
-            stdout=subprocess.PIPE, text=True, check=True
-        )
-    except subprocess.CalledProcessError:
-        return None
-
-    for line in result.stdout.splitlines():
-        parts = line.split(None, 2)
-        if len(parts) < 3:
-            continue
-        name, rm, mount = parts[0], parts[1], parts[2]
-        if rm == "1" and mount != "":
-            candidate = Path(mount) / "AstraAdminTool"
-            if candidate.exists() and candidate.is_dir():
-                return candidate
-    return None
+    found = find_media(has_tool)
+    if not found:
+        print(f"[INFO] Ожидание флешки с AstraAdminTool ({MEDIA_WAIT} с)...")
+        found = wait_for_media(has_tool, MEDIA_WAIT)
+    return found
 
 
 def copy_project():
@@ -52,7 +43,7 @@ def copy_project():
             sys.exit(1)
 
         print(f"[INFO] Копирую проект {flash_dir} → {TARGET_DIR}")
-        shutil.copytree(flash_dir, TARGET_DIR)
+        copytree(flash_dir, TARGET_DIR, log_func=print)
         print("[OK] Копирование завершено.")
 
 
@@ -66,15 +57,15 @@ def run_python(script_name):
     subprocess.Popen(["python3", str(script_path)], cwd=TARGET_DIR)
 
 
-def run_shell(shell_name):
-    """Запускает shell-скрипт из TARGET_DIR и ждёт завершения"""
-    shell_path = TARGET_DIR / shell_name
-    if not shell_path.exists():
-        QMessageBox.critical(None, "Ошибка", f"Файл {shell_path} не найден")
+def run_report(script_name):
+    """Запускает Python-сборщик отчета из TARGET_DIR и ждёт завершения"""
+    script_path = TARGET_DIR / script_name
+    if not script_path.exists():
+        QMessageBox.critical(None, "Ошибка", f"Файл {script_path} не найден")
         return
 
     QApplication.quit()
-    subprocess.run(["bash", str(shell_path)], cwd=TARGET_DIR)
+    subprocess.run(["python3", str(script_path)], cwd=TARGET_DIR)
 
     # После завершения перезапускаем GUI
     subprocess.Popen(["python3", str(BASE_DIR / "start.py")])
@@ -120,7 +111,7 @@ class Launcher(QWidget):
         layout.setSpacing(50)  # расстояние между кнопками
 
         btn1 = QPushButton("Настройка\nсистемы")
-        btn3 = QPushButton("Сбор логов\n(status_log.sh)")
+        btn3 = QPushButton("Сбор логов\n(sysreport.py)")
         btn4 = QPushButton("Выход")
 
         # фон для кнопок
@@ -138,7 +129,7 @@ class Launcher(QWidget):
             #""")
 
         btn1.clicked.connect(lambda: run_python("main.py"))
-        btn3.clicked.connect(lambda: run_shell("status_log.sh"))
+        btn3.clicked.connect(lambda: run_report("sysreport.py"))
         btn4.clicked.connect(cancel_app)
 
 
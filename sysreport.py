@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сбор отчетной информации с компьютера (замена status_log.sh).
+
+Каждая проверка — отдельная проба со своим тайм-аутом (и для команд, и
+для проб внутри процесса, см. call_probe). Независимые пробы
+выполняются одновременно пулом потоков через scheduler.run_dag, зависимые
+(smartctl после установки smartmontools) ждут свои зависимости. Результат
+каждой пробы (ok, failed, timeout, skipped) записывается в отчет
+<host>_probes.txt и в конец <host>.txt вместо строк «Все пропало».
+
+Файлы и каталоги (/etc/HMI, проект, /var/log и т.д.) читаются прямо в
+zip-архив (report_archive), без копии в /var/tmp и без вложенных tar.gz.
+Пробы-архивации держат блокировку «archive», поэтому в архив пишет одна
+проба за раз, а пробы-команды идут параллельно с ними.
+
+Формат архива: zip (по умолчанию, сжатые файлы без пересжатия), tar.gz
+или tar.zst (многопоточное сжатие всего потока, --level — уровень).
+
+С --delta в архив попадают только файлы, новые или измененные со времени
+прошлого сбора (report_delta), и индекс <host>_delta.json. --baseline —
+полный сбор, который тоже сохраняет манифест для следующего --delta;
+обычный полный сбор манифест не ведет и хеши файлов не считает.
+
+С --media архив пишется сразу на съемный носитель (с наибольшим
+свободным местом) томами не больше 4 ГиБ для FAT32; --volume-size задает
+размер тома в МиБ. Рядом кладется <архив>.sha256, сборка и проверка —
+report_volumes.py.
+
+Размеры каталогов /var, /home, /opt считает du_scan (вместо du -hs) с
+кэшем по mtime каталогов; кроме текста в архив кладется <host>_du.json
+с размерами и самыми большими файлами.
+
+Запуск: sudo python3 sysreport.py [каталог] [--format zip|tar.gz|tar.zst]
+        [--level N] [--threads N] [--delta | --baseline] [--media] [--volume-size МиБ]
+"""
+import os
+import pwd
+import sys
+import glob
+import json
+import argparse
+import time
+import threading
+import shutil
+import signal
+import socket
+import platform
+import subprocess
+import urllib.request
+from datetime import datetime, date, timedelta
+from pathlib import Path
+
+from scheduler import Task, run_dag
+from cmd_stream import tracked
+from report_archive import ReportArchive, FORMATS, open_archive
+from parallel_compress import COMPRESS_THREADS
+from report_delta import DeltaState
+from report_volumes import VolumeWriter, VOLUME_SIZE
+from media import removable_mounts
+from du_scan import DU_ROOTS, scan, format_report
+
+PROBE_TIMEOUT = 60
+ARCHIVE_TIMEOUT = 1800
+DU_TIMEOUT = 600
+# Запас сверх тайм-аута: команды пробы убиваются по нему сами и успевают
+# вернуть частичный вывод
+TIMEOUT_GRACE = 5
+REPORT_WORKERS = 8
+HOST = socket.gethostname()
+HASP_URL = "http://127.0.0.1:1947/csv/features.txt"
+SHADOW = "/etc/shadow"
+UID_MIN = 1000
+
+# Файлы отчета: ключ пробы -> суффикс имени файла
+MAIN, HARD, INST, SSD, HASP = "", "_hard", "_inst", "_ssd", "_hasp"
+ARCHIVE = "_archive"
+
+OK, FAILED, TIMEOUT, SKIPPED = "ok", "failed", "timeout", "skipped"
+
+# Файлы и каталоги, которые кладутся в архив как есть: (путь или шаблон,
+# имя в архиве; None — имя файла)
+ARCHIVE_SOURCES = (
+    ("/etc/hosts", None),
+    ("/etc/apt/sources.list", None),
+    ("/etc/X11/fly-dm/fly-dmrc", None),
+    ("/etc/fly-kiosk", "fly-kiosk"),
+    ("/etc/chrony/chrony.conf", None),
+    ("/etc/X11/xorg.conf", None),
+    ("/share/IntegrityClientSecurity-*/data/clientsecurity", None),
+    ("/etc/HMI", None),
+    ("/etc/Integrity", None),
+    ("/usr/bin/IntegrityDataTransport.xml", None),
+    ("/var/IntegrityEnvCtrl", None),
+    ("/Integrity/Projects", None),
+    ("/var/log", "log"),
+)
+
+
+class ProbeError(Exception):
+    """Проба не удалась; output — то, что она успела вывести."""
+
+    def __init__(self, message, output="", status=FAILED):
+        super().__init__(message)
+        self.output = output
+        self.status = status
+
+
+class Probe:
+    """
+    Проба: func(probe) возвращает текст для раздела title файла target.
+    timeout ограничивает всю пробу (call_probe). Структурированный
+    результат func может положить в probe.data — он пишется в
+    <host>_<key>.json.
+    """
+
+    def __init__(self, key, title, func, target=MAIN, timeout=PROBE_TIMEOUT,
+                 deps=(), locks=()):
+        self.key = key
+        self.title = title
+        self.func = func
+        self.target = target
+        self.timeout = timeout
+        self.deps = tuple(deps)
+        self.locks = tuple(locks)
+        self.data = None
+        self.deadline = None
+
+
+class ProbeResult:
+    def __init__(self, key, status, output="", elapsed=0.0, error=""):
+        self.key = key
+        self.status = status
+        self.output = output
+        self.elapsed = elapsed
+        self.error = error
+
+
+def run_command(cmd, timeout, check=True):
+    """
+    Выполняет команду с тайм-аутом; по его истечении убивает всю группу
+    процессов. Возвращает stdout+stderr.
+    """
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                start_new_session=True)
+    except OSError as e:
+        raise ProbeError(f"{cmd[0]}: {e}")
+    with tracked(proc):
+        try:
+            out, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            out, _ = proc.communicate()
+            raise ProbeError(f"{cmd[0]}: нет ответа за {timeout} с",
+                             out.decode("utf-8", "replace"), TIMEOUT)
+    text = out.decode("utf-8", "replace")
+    if check and proc.returncode != 0:
+        raise ProbeError(f"{cmd[0]}: код возврата {proc.returncode}", text)
+    return text
+
+
+def command(*cmd, check=True):
+    return lambda probe: run_command(list(cmd), probe.timeout, check)
+
+
+def read_file(path):
+    def func(_probe):
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        except OSError as e:
+            raise ProbeError(f"{path}: {e.strerror}")
+    return func
+
+
+def password_expiry(_probe):
+    """Срок действия паролей пользователей с UID >= 1000 (по /etc/shadow)."""
+    users = {p.pw_name for p in pwd.getpwall() if p.pw_uid >= UID_MIN}
+    lines = []
+    with open(SHADOW, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.rstrip("\n").split(":")
+            if len(fields) < 5 or fields[0] not in users:
+                continue
+            last, max_days = fields[2], fields[4]
+            if not last.isdigit() or not max_days.isdigit() \
+                    or int(max_days) >= 99999:
+                continue
+            expires = date(1970, 1, 1) + timedelta(int(last) + int(max_days))
+            lines.append(f"{fields[0]} Пароль истекает : {expires:%d.%m.%Y}")
+    return "\n".join(lines)
+
+
+def smartmontools(probe):
+    if shutil.which("smartctl"):
+        return "Программа smartmontools уже установлена"
+    run_command(["apt-get", "install", "-y", "smartmontools"], probe.timeout)
+    return "Установлена smartmontools"
+
+
+def hasp_features(probe):
+    try:
+        with urllib.request.urlopen(HASP_URL, timeout=probe.timeout) as resp:
+            return resp.read().decode("utf-8", "replace")
+    except OSError as e:
+        raise ProbeError(f"лицензий Integrity не обнаружено: {e}")
+
+
+def block_disks():
+    """Диски из /sys/block (как lsblk -nd), без loop и ram."""
+    try:
+        names = sorted(os.listdir("/sys/block"))
+    except OSError:
+        return []
+    return [n for n in names if not n.startswith(("loop", "ram", "zram"))]
+
+
+def archive_item(src, archive: ReportArchive, arcname=None):
+    """Проба: файл или каталог src (допускается шаблон) прямо в архив."""
+    def func(probe):
+        paths = glob.glob(src)
+        if not paths:
+            raise ProbeError(f"{src} отсутствует")
+        path = paths[0]
+        name = arcname or os.path.basename(path)
+        files, size = archive.files, archive.bytes
+
+        def added():
+            return (f"Добавлено {path}: {archive.files - files} файлов, "
+                    f"{archive.bytes - size} байт")
+
+        try:
+            errors = archive.add_path(path, name, probe.deadline)
+        except TimeoutError:
+            errors = None
+        except BaseException:
+            if archive.delta is not None:
+                archive.delta.carry_forward(os.path.abspath(path))
+            raise
+        if errors != [] and archive.delta is not None:
+            # Непройденные файлы не должны попасть в удаленные
+            archive.delta.carry_forward(os.path.abspath(path))
+        if errors is None:
+            raise ProbeError(f"не уложились в {probe.timeout} с", added(),
+                             TIMEOUT)
+        if errors:
+            raise ProbeError(f"не прочитано файлов: {len(errors)}",
+                             "\n".join([added()] + errors))
+        return added()
+    return func
+
+
+def disk_usage(probe):
+    """Размеры каталогов (du_scan) с кэшем; данные — в probe.data."""
+    # Как du -hs без проверки кода: ошибки доступа в вывод, проба не падает
+    try:
+        probe.data = scan(deadline=probe.deadline)
+    except TimeoutError:
+        raise ProbeError(f"не уложились в {probe.timeout} с", status=TIMEOUT)
+    return "\n".join([format_report(probe.data)] + probe.data["errors"])
+
+
+def default_probes(archive: ReportArchive):
+    """Пробы в порядке разделов исходного status_log.sh."""
+    probes = [
+        Probe("kernel", "Версия ядра", lambda _p: platform.release()),
+        Probe("build", "Вывод установленной версии",
+              read_file("/etc/astra/build_version")),
+        Probe("license", "Вывод лицензии", read_file("/etc/astra_license")),
+        Probe("overlay", "Вывод состояния overlay",
+              command("astra-overlay", "status")),
+        Probe("secmon", "Монитор безопасности astra-security-monitor",
+              command("astra-security-monitor", "status")),
+        Probe("df", "Вывод размера партиций", command("df", "-h")),
+        Probe("free", "Вывод размера swap", command("free", "-l")),
+        Probe("ip", "Вывод сетевых адресов", command("ip", "addr")),
+    ]
+    probes += [
+        Probe("du", "Вывод размера места на диске по каталогам "
+              + ", ".join(f"{root}/*" for root in DU_ROOTS), disk_usage,
+              timeout=DU_TIMEOUT),
+        Probe("passwords", "Время жизни паролей пользователей системы",
+              password_expiry),
+        Probe("lspci", "Вывод перечня установленного оборудования",
+              command("lspci", "-vv"), HARD),
+        Probe("dpkg", "Вывод списка установленных программ",
+              command("dpkg-query", "-l"), INST),
+        Probe("smartmontools", "Вывод состояния SSD", smartmontools, SSD,
+              timeout=300),
+    ]
+    for disk in block_disks():
+        # smartctl возвращает битовую маску предупреждений, вывод нужен всегда
+        probes.append(Probe(
+            f"smart:{disk}", f"SMART /dev/{disk}",
+            command("smartctl", "-i", "-a", f"/dev/{disk}", check=False),
+            SSD, deps=("smartmontools",)))
+    probes += [
+        Probe("hasp", "Список лицензий", hasp_features, HASP, timeout=15),
+        Probe("guardant", "Список лицензий Guardant",
+              command("license_wizard", "--console", "--list"), HASP),
+    ]
+    for src, arcname in ARCHIVE_SOURCES:
+        probes.append(Probe(f"archive:{src}", src,
+                            archive_item(src, archive, arcname), ARCHIVE,
+                            timeout=ARCHIVE_TIMEOUT, locks=("archive",)))
+    return probes
+
+
+def call_probe(probe):
+    """
+    probe.func с ограничением probe.timeout. Проба идет в отдельном
+    потоке; если он не уложился, проба получает статус timeout, а поток
+    дорабатывает в фоне и на отчет уже не влияет. Пробы с блокировками
+    (запись в архив) так бросить нельзя: пока поток жив, архив занят.
+    Они выполняются напрямую и сами следят за probe.deadline.
+    """
+    probe.deadline = time.monotonic() + probe.timeout
+    if probe.locks:
+        return probe.func(probe)
+    outcome = {}
+
+    def target():
+        try:
+            outcome["output"] = probe.func(probe)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, name=f"probe:{probe.key}",
+                              daemon=True)
+    thread.start()
+    thread.join(probe.timeout + TIMEOUT_GRACE)
+    if thread.is_alive():
+        raise ProbeError(f"нет ответа за {probe.timeout} с", status=TIMEOUT)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["output"]
+
+
+def run_probes(probes, log_func, workers=REPORT_WORKERS):
+    """Выполняет пробы с учетом зависимостей. Возвращает {key: ProbeResult}."""
+    results = {}
+
+    def task_func(probe):
+        def run(_log_func):
+            started = time.monotonic()
+            try:
+                output = call_probe(probe)
+            except ProbeError as e:
+                results[probe.key] = ProbeResult(
+                    probe.key, e.status, e.output,
+                    time.monotonic() - started, str(e))
+                raise
+            except Exception as e:
+                results[probe.key] = ProbeResult(
+                    probe.key, FAILED, "", time.monotonic() - started, str(e))
+                raise
+            results[probe.key] = ProbeResult(
+                probe.key, OK, output, time.monotonic() - started)
+        return run
+
+    tasks = [Task(p.key, task_func(p), p.deps, p.locks) for p in probes]
+    run_dag(tasks, log_func, workers)
+    for probe in probes:
+        results.setdefault(probe.key, ProbeResult(
+            probe.key, SKIPPED, error="не выполнена: не удалась зависимость"))
+    return results
+
+
+def summary_lines(probes, results):
+    lines = []
+    for probe in probes:
+        r = results[probe.key]
+        error = f": {r.error}" if r.error else ""
+        lines.append(f"[{r.status.upper()}] {probe.key} ({r.elapsed:.1f} с){error}")
+    return lines
+
+
+def report_texts(probes, results):
+    """Тексты файлов отчета {target: текст} в порядке проб."""
+    texts = {}
+    for probe in probes:
+        if probe.title is None:
+            continue
+        r = results[probe.key]
+        parts = texts.setdefault(probe.target, [])
+        parts.append(probe.title)
+        if r.output:
+            parts.append(r.output.rstrip("\n"))
+        if r.status != OK:
+            parts.append(f"[{r.status.upper()}] {r.error}")
+        parts.append("")
+    failed = [line for line in summary_lines(probes, results)
+              if not line.startswith(f"[{OK.upper()}]")]
+    texts.setdefault(MAIN, []).extend(
+        ["Неудачные пробы"] + (failed or ["нет"]) + [""])
+    return {target: "\n".join(parts) + "\n" for target, parts in texts.items()}
+
+
+def report_owner():
+    """Пользователь, запустивший sudo (как logname в status_log.sh)."""
+    name = os.environ.get("SUDO_USER")
+    if not name:
+        try:
+            name = os.getlogin()
+        except OSError:
+            return None
+    try:
+        return pwd.getpwnam(name)
+    except KeyError:
+        return None
+
+
+def report_media():
+    """Съемный носитель, доступный для записи, с наибольшим свободным местом."""
+    best, best_free = None, -1
+    for mount in removable_mounts():
+        try:
+            st = os.statvfs(mount)
+        except OSError:
+            continue
+        free = st.f_bavail * st.f_frsize
+        if os.access(mount, os.W_OK) and free > best_free:
+            best, best_free = mount, free
+    return best
+
+
+def collect(out_dir: Path, log_func=print, workers=REPORT_WORKERS,
+            fmt="zip", level=None, threads=COMPRESS_THREADS, delta=False,
+            volume_size=None, baseline=False):
+    """
+    Собирает отчет в архив формата fmt и возвращает путь к нему.
+    delta=True — только файлы, изменившиеся со времени прошлого сбора.
+    baseline=True — полный сбор с сохранением манифеста для delta.
+    volume_size — писать томами этого размера; тогда возвращается путь
+    к файлу .sha256 с контрольными суммами томов.
+    """
+    started = time.monotonic()
+    stamp = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
+    kind = "_delta" if delta else ""
+    path = Path(out_dir) / f"log_archiv_{HOST}_{stamp}{kind}{FORMATS[fmt][0]}"
+    state = DeltaState.load(full=not delta) if delta or baseline else None
+    if delta and state.base is None:
+        log_func("[WARN] Прошлый сбор не найден, собираются все файлы")
+    elif delta:
+        log_func(f"[INFO] Изменения относительно {state.base}")
+
+    out = VolumeWriter(path, volume_size) if volume_size else open(path, "wb")
+    with out, open_archive(out, fmt, level, threads) as archive:
+        archive.delta = state
+        probes = default_probes(archive)
+        log_func(f"[INFO] Сбор отчета: {len(probes)} проб, {workers} потоков")
+        results = run_probes(probes, log_func, workers)
+        for target, text in report_texts(probes, results).items():
+            archive.add_bytes(f"{HOST}{target}.txt", text.encode("utf-8"))
+        archive.add_bytes(
+            f"{HOST}_probes.txt",
+            ("\n".join(summary_lines(probes, results)) + "\n").encode("utf-8"))
+        for probe in probes:
+            if probe.data is not None:
+                archive.add_bytes(f"{HOST}_{probe.key}.json", json.dumps(
+                    probe.data, ensure_ascii=False, indent=1).encode("utf-8"))
+        if state is not None:
+            index = state.index(path.name)
+            archive.add_bytes(f"{HOST}_delta.json", json.dumps(
+                index, ensure_ascii=False, indent=1).encode("utf-8"))
+    if volume_size:
+        log_func(f"[INFO] Томов: {len(out.volumes)}, суммы в {out.sums}")
+        files = [v for v, _digest in out.volumes] + [out.sums]
+        result = out.sums
+    else:
+        files = [path]
+        result = path
+    if state is not None:
+        # Основа следующего delta — имя архива, как в <host>_delta.json
+        state.save(path.name)
+        log_func(f"[INFO] Файлов: новых {len(index['added'])}, измененных "
+                 f"{len(index['changed'])}, удаленных {len(index['deleted'])}, "
+                 f"без изменений {index['unchanged']}")
+
+    owner = report_owner()
+    for name in files if owner else ():
+        try:
+            os.chown(name, owner.pw_uid, owner.pw_gid)
+        except OSError:
+            pass  # FAT32 не хранит владельцев
+    bad = sum(1 for r in results.values() if r.status != OK)
+    log_func(f"[OK] Отчет {result} собран за {time.monotonic() - started:.1f} с"
+             f" (неудачных проб: {bad})")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сбор отчета с компьютера")
+    parser.add_argument("out_dir", nargs="?", type=Path, default=Path.cwd(),
+                        help="каталог для архива (по умолчанию текущий)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="zip")
+    parser.add_argument("--level", type=int, default=None,
+                        help="уровень сжатия (gzip 1-9, zstd 1-19)")
+    parser.add_argument("--threads", type=int, default=COMPRESS_THREADS,
+                        help="потоков сжатия для tar.gz/tar.zst")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--delta", action="store_true",
+                      help="только файлы, изменившиеся с прошлого сбора")
+    mode.add_argument("--baseline", action="store_true",
+                      help="полный сбор с манифестом для следующего --delta")
+    parser.add_argument("--media", action="store_true",
+                        help="писать на съемный носитель томами для FAT32")
+    parser.add_argument("--volume-size", type=int, default=None,
+                        help="размер тома, МиБ")
+    args = parser.parse_args(argv)
+    out_dir = args.out_dir
+    volume_size = args.volume_size * 1024 * 1024 if args.volume_size else None
+    if args.media:
+        out_dir = report_media()
+        if out_dir is None:
+            print("[ERR] Съемный носитель для записи не найден")
+            return 1
+        print(f"[INFO] Запись на {out_dir}")
+        volume_size = volume_size or VOLUME_SIZE
+    collect(out_dir, fmt=args.format, level=args.level, threads=args.threads,
+            delta=args.delta, volume_size=volume_size, baseline=args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выполнение задач в фоновом потоке Qt.
+
+Обработчики вида func(log_func) запускаются в QThread через планировщик
+scheduler.run_dag, строки лога передаются в GUI сигналом сразу по мере
+появления. Отмена кооперативная:
+следующий вызов log_func выбрасывает TaskCancelled, а запущенные задачей
+дочерние процессы (зарегистрированные через cmd_stream.tracked) завершаются.
+Строки передаются вместе с именем задачи, которая их вывела; время и
+ресурсы каждой задачи замеряются в profile (profiling.RunProfile).
+"""
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from scheduler import Task, run_dag, PROVISION_WORKERS
+from cmd_stream import terminate_children
+from applog import task_context, current_task, level_of
+from profiling import RunProfile
+
+
+class TaskCancelled(BaseException):
+    """Задача остановлена оператором.
+
+    Наследуется от BaseException, чтобы не перехватываться
+    обработчиками с `except Exception`.
+    """
+
+
+# Рабочий поток, выполняющий задачу в текущем потоке пула
+_current = threading.local()
+
+
+def check_cancelled():
+    """
+    Выбрасывает TaskCancelled, если задача текущего потока отменена.
+    Для ожиданий, которые не пишут в лог на каждом шаге.
+    """
+    worker = getattr(_current, "worker", None)
+    if worker is not None and worker.is_cancelled():
+        raise TaskCancelled()
+
+
+class TaskWorker(QThread):
+    """Выполняет список scheduler.Task с учетом зависимостей."""
+
+    line = pyqtSignal(str, str)
+    task_started = pyqtSignal(str)
+    task_finished = pyqtSignal(str, float)
+    task_skipped = pyqtSignal(str)
+    all_finished = pyqtSignal(bool)
+
+    def __init__(self, tasks, parent=None, workers=PROVISION_WORKERS):
+        super().__init__(parent)
+        self.tasks = list(tasks)
+        self.workers = workers
+        self._cancel = threading.Event()
+        self.profile = RunProfile("provision")
+
+    def log(self, msg):
+        if self._cancel.is_set():
+            raise TaskCancelled()
+        self.line.emit(msg, current_task() or "")
+
+    def cancel(self):
+        self._cancel.set()
+        terminate_children()
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def _emit(self, msg):
+        # Сообщения планировщика не должны прерываться отменой
+        self.line.emit(msg, "")
+
+    def _bind(self, task):
+        """
+        Копия задачи с именем в task_context и замером в profile.
+        Обработчики сами перехватывают свои ошибки и пишут [ERR] в лог,
+        поэтому такая строка отмечает задачу в профиле как неудачную.
+        """
+        def run(log_func):
+            _current.worker = self
+            with task_context(task.name), \
+                    self.profile.measure(task.name) as measured:
+                def log(msg):
+                    if level_of(msg) == "ERR":
+                        measured.fail()
+                    log_func(msg)
+                return task.func(log)
+        return Task(task.key, run, task.deps, task.locks, task.name)
+
+    def run(self):
+        cancelled = False
+        try:
+            run_dag(
+                [self._bind(t) for t in self.tasks], self.log, self.workers, report=self._emit,
+                on_start=lambda t: self.task_started.emit(t.name),
+                on_finish=lambda t, elapsed, _e: self.task_finished.emit(
+                    t.name, elapsed),
+                on_skip=lambda t: self.task_skipped.emit(t.name))
+        except TaskCancelled:
+            cancelled = True
+        self.all_finished.emit(cancelled)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import zipfile
+
+from zip_extract import extract_members
+
+
+def test_extract_many_members_per_directory(tmp_path):
+    archive = tmp_path / "many.zip"
+    names = []
+    with zipfile.ZipFile(archive, "w") as z:
+        for d in range(200):
+            for f in range(8):
+                name = f"root/dir{d:03d}/sub/file{f}.txt"
+                z.writestr(name, f"{d}:{f}")
+                names.append(name)
+    for run in range(5):
+        dest = tmp_path / f"out{run}"
+        extract_members(archive, names, dest, workers=8)
+        for name in names:
+            d, f = name.split("/")[1][3:], name[-5]
+            assert (dest / name).read_text() == f"{int(d)}:{f}"
+
+
+def test_extract_directory_members(tmp_path):
+    archive = tmp_path / "dirs.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("a/", "")
+        z.writestr("a/b/", "")
+        z.writestr("a/b/c.txt", "c")
+    extract_members(archive, ["a/", "a/b/", "a/b/c.txt"], tmp_path / "out")
+    assert (tmp_path / "out" / "a" / "b").is_dir()
+    assert (tmp_path / "out" / "a" / "b" / "c.txt").read_text() == "c"
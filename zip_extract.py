@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выборочная и параллельная распаковка zip по центральному каталогу.
+
+ZipPlan читает только центральный каталог архива и находит нужные
+элементы по имени файла без распаковки. StagedExtraction сначала
+распаковывает то, что нужно сразу (каталог установщика, json-файлы),
+а остальное — в фоновом потоке, пока работает установщик. Элементы
+распаковываются пулом потоков, у каждого потока свой дескриптор zip
+(zlib отпускает GIL, поэтому распаковка действительно параллельна).
+Каталоги создаются заранее в вызывающем потоке: ZipFile.extract создает
+их без exist_ok, и параллельные потоки мешали бы друг другу.
+"""
+import os
+import posixpath
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+from copy_engine import PROGRESS_INTERVAL
+
+EXTRACT_WORKERS = os.cpu_count() or 2
+
+
+class ZipPlan:
+    """Список элементов архива из центрального каталога."""
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        with zipfile.ZipFile(zip_path, "r") as z:
+            self.infos = z.infolist()
+        self.names = [i.filename for i in self.infos]
+
+    def find(self, basename, preferred=None):
+        """Элемент с данным именем файла; preferred — желаемый путь-суффикс."""
+        matches = [n for n in self.names
+                   if not n.endswith("/") and posixpath.basename(n) == basename]
+        if preferred:
+            for n in matches:
+                if n == preferred or n.endswith("/" + preferred):
+                    return n
+        return matches[0] if matches else None
+
+    def under(self, member):
+        """Все элементы из каталога, в котором лежит member."""
+        prefix = posixpath.dirname(member)
+        if not prefix:
+            return list(self.names)
+        prefix += "/"
+        return [n for n in self.names if n.startswith(prefix)]
+
+    def total_size(self):
+        return sum(i.file_size for i in self.infos)
+
+
+def _member_path(dest, name):
+    """Путь файла элемента name в dest (так же, как у ZipFile.extract)."""
+    parts = [p for p in name.split("/") if p not in ("", ".", "..")]
+    return os.path.join(dest, *parts)
+
+
+def extract_members(zip_path, members, dest, workers=None, progress=None):
+    """
+    Распаковывает members в dest параллельно, по дескриптору на поток.
+    progress (copy_engine.Progress) получает размеры распакованных файлов
+    и выводится из вызывающего потока.
+    """
+    local = threading.local()
+    handles = []
+    lock = threading.Lock()
+    files = []
+    dirs = {os.path.abspath(dest)}
+    for name in members:
+        path = _member_path(dest, name)
+        if name.endswith("/"):
+            dirs.add(path)
+        else:
+            dirs.add(os.path.dirname(path))
+            files.append(name)
+    for path in sorted(dirs):
+        os.makedirs(path, exist_ok=True)
+
+    def extract(name):
+        z = getattr(local, "zip", None)
+        if z is None:
+            z = local.zip = zipfile.ZipFile(zip_path, "r")
+            with lock:
+                handles.append(z)
+        z.extract(name, dest)
+        if progress:
+            progress.add(z.getinfo(name).file_size)
+            progress.file_done()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers or EXTRACT_WORKERS) as pool:
+            pending = {pool.submit(extract, name) for name in files}
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=PROGRESS_INTERVAL,
+                                         return_when=FIRST_EXCEPTION)
+                    for fut in done:
+                        fut.result()
+                    if pending and progress:
+                        progress.report()
+            except BaseException:
+                for fut in pending:
+                    fut.cancel()
+                raise
+    finally:
+        for z in handles:
+            z.close()
+
+
+class StagedExtraction:
+    """
+    Распаковка в два этапа: first — сразу (start ждет их), остальное —
+    в фоне. wait() дожидается фона, пробрасывает его ошибку и
+    возвращает размер распакованных данных.
+    """
+
+    def __init__(self, plan: ZipPlan, dest, first, workers=None):
+        self.plan = plan
+        self.dest = dest
+        self.first = list(dict.fromkeys(first))
+        self.workers = workers
+        self._thread = None
+        self._error = None
+
+    def _rest(self):
+        done = set(self.first)
+        rest = [n for n in self.plan.names if n not in done]
+        try:
+            extract_members(self.plan.zip_path, rest, self.dest, self.workers)
+        except BaseException as e:
+            self._error = e
+
+    def start(self):
+        extract_members(self.plan.zip_path, self.first, self.dest, self.workers)
+        self._thread = threading.Thread(target=self._rest, daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.plan.total_size()